@@ -0,0 +1,35 @@
+"""
+API依赖注入
+"""
+from fastapi import Request
+
+from app.services.chat_service import ChatService
+from app.services.container import ServiceContainer
+from app.services.ingest_jobs import IngestJobManager
+from app.services.rag_service import RAGService
+from app.services.upload_service import UploadService
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """获取应用级服务容器"""
+    return request.app.state.services
+
+
+def get_chat_service(request: Request) -> ChatService:
+    """获取共享的聊天服务"""
+    return get_services(request).chat_service
+
+
+def get_rag_service(request: Request) -> RAGService:
+    """获取共享的RAG服务"""
+    return get_services(request).rag_service
+
+
+def get_ingest_jobs(request: Request) -> IngestJobManager:
+    """获取后台导入任务管理器"""
+    return get_services(request).ingest_jobs
+
+
+def get_upload_service(request: Request) -> UploadService:
+    """获取文档上传服务"""
+    return get_services(request).upload_service
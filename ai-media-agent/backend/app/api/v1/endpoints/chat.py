@@ -4,6 +4,7 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from typing import List, Optional
+from app.api.deps import get_chat_service
 from app.services.chat_service import ChatService
 
 router = APIRouter()
@@ -24,9 +25,11 @@ class ChatResponse(BaseModel):
 
 
 @router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    service: ChatService = Depends(get_chat_service)
+):
     """处理用户问题"""
-    service = ChatService()
     result = await service.process_question(
         message=request.message,
         user_id=request.user_id,
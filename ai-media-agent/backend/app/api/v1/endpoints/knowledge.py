@@ -1,9 +1,15 @@
 """
 知识库管理API
 """
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from pydantic import BaseModel
 from typing import List
+from app.api.deps import get_ingest_jobs, get_rag_service, get_services, get_upload_service
+from app.services.container import ServiceContainer
+from app.services.ingest_jobs import IngestJob, IngestJobManager, JobConflictError
+from app.services.knowledge_loader import KnowledgeLoader
+from app.services.rag_service import RAGService
+from app.services.upload_service import UploadService, UploadTooLargeError
 
 router = APIRouter()
 
@@ -16,25 +22,79 @@ class KnowledgeStatus(BaseModel):
 
 
 @router.get("/status", response_model=KnowledgeStatus)
-async def get_knowledge_status():
+async def get_knowledge_status(rag_service: RAGService = Depends(get_rag_service)):
     """获取知识库状态"""
-    # TODO: 实现知识库状态查询
+    stats = await rag_service.get_stats()
     return {
-        "total_documents": 0,
-        "total_chunks": 0,
-        "last_updated": "2025-01-01"
+        "total_documents": stats.get("total_documents", 0),
+        "total_chunks": stats.get("total_chunks", 0),
+        "last_updated": stats.get("last_updated") or ""
     }
 
 
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    """上传文档到知识库"""
-    # TODO: 实现文档上传和处理
-    return {"message": f"File {file.filename} uploaded successfully"}
+@router.get("/cache")
+async def get_query_cache_stats(rag_service: RAGService = Depends(get_rag_service)):
+    """获取检索缓存命中统计"""
+    return {
+        "query_results": rag_service.query_cache.stats(),
+        "query_embeddings": rag_service.query_embedder.stats()
+    }
+
+
+@router.post("/upload", status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    upload_service: UploadService = Depends(get_upload_service)
+):
+    """上传文档到知识库（流式保存后在后台导入，立即返回job id；重复内容直接返回）"""
+    try:
+        return await upload_service.submit(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await file.close()
+
+
+@router.post("/rebuild", status_code=202)
+async def rebuild_knowledge_base(
+    services: ServiceContainer = Depends(get_services),
+    jobs: IngestJobManager = Depends(get_ingest_jobs)
+):
+    """重建知识库索引（后台任务，立即返回job id；期间上传和帖子导入排队等待）"""
+    async def run(job: IngestJob) -> bool:
+        loader = KnowledgeLoader(services.rag_service, progress=job.progress)
+        return await loader.rebuild_index(services.ingest_lock)
+    
+    try:
+        job = jobs.submit("rebuild", run)
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+
+@router.get("/jobs")
+async def list_jobs(jobs: IngestJobManager = Depends(get_ingest_jobs)):
+    """列出最近的后台导入任务"""
+    return [job.to_dict() for job in jobs.list()]
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, jobs: IngestJobManager = Depends(get_ingest_jobs)):
+    """查询后台任务状态与各阶段进度"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 
-@router.post("/rebuild")
-async def rebuild_knowledge_base():
-    """重建知识库索引"""
-    # TODO: 实现知识库重建
-    return {"message": "Knowledge base rebuild started"}
\ No newline at end of file
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, jobs: IngestJobManager = Depends(get_ingest_jobs)):
+    """取消运行中的后台任务"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+    return {"job_id": job_id, "cancelling": True}
\ No newline at end of file
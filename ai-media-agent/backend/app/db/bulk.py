@@ -0,0 +1,54 @@
+"""
+批量写入工具
+"""
+import json
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import JSON, Table
+
+from app.db.base import engine
+
+logger = logging.getLogger(__name__)
+
+
+async def replace_table_rows(table: Table, rows: List[Dict[str, Any]]) -> int:
+    """
+    在一个事务内用 rows 整体替换表内容
+    
+    asyncpg 驱动下用 COPY（copy_records_to_table）批量写入，其他驱动退回
+    executemany。rows 的键为列名，未给出的列使用数据库默认值。
+    
+    Returns:
+        写入的行数
+    """
+    columns = list(rows[0].keys()) if rows else []
+    
+    async with engine.begin() as conn:
+        await conn.execute(table.delete())
+        if not rows:
+            return 0
+        
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        if hasattr(driver, "copy_records_to_table"):
+            # COPY 绕过SQLAlchemy的类型处理，JSON列需要先序列化
+            json_columns = {
+                name for name in columns
+                if isinstance(table.c[name].type, JSON)
+            }
+            records = [
+                tuple(
+                    json.dumps(row[name], ensure_ascii=False)
+                    if name in json_columns and row[name] is not None
+                    else row[name]
+                    for name in columns
+                )
+                for row in rows
+            ]
+            await driver.copy_records_to_table(table.name, records=records, columns=columns)
+        else:
+            await conn.execute(table.insert(), rows)
+    
+    logger.info(f"Replaced {table.name}: {len(rows)} rows")
+    return len(rows)
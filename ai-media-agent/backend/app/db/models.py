@@ -7,6 +7,7 @@ from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 import uuid
 
+from app.core.config import settings
 from app.db.base import Base
 
 
@@ -20,8 +21,9 @@ class KnowledgeChunk(Base):
     source_type = Column(String(50), nullable=False, comment="来源类型")
     chunk_index = Column(Integer, nullable=False, comment="块索引")
     total_chunks = Column(Integer, nullable=False, comment="总块数")
-    embedding = Column(Vector(1536), comment="向量表示")  # OpenAI embedding维度
-    metadata = Column(JSON, comment="元数据")
+    embedding = Column(Vector(settings.EMBEDDING_DIMENSION), comment="向量表示")  # OpenAI embedding维度
+    # metadata 是SQLAlchemy Declarative的保留属性名，列名保持不变
+    chunk_metadata = Column("metadata", JSON, comment="元数据")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -12,9 +12,14 @@ logger = logging.getLogger(__name__)
 class ChatService:
     """聊天服务"""
     
-    def __init__(self):
-        self.rag_service = RAGService()
-        self.llm_service = LLMService()
+    def __init__(
+        self,
+        rag_service: Optional[RAGService] = None,
+        llm_service: Optional[LLMService] = None
+    ):
+        # 优先复用应用级共享实例（见 ServiceContainer）
+        self.rag_service = rag_service or RAGService()
+        self.llm_service = llm_service or LLMService()
     
     async def process_question(
         self,
@@ -0,0 +1,62 @@
+"""
+应用级服务容器
+"""
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.db.base import engine
+from app.services.chat_service import ChatService
+from app.services.generation_watcher import GenerationWatcher
+from app.services.ingest_jobs import IngestJobManager
+from app.services.llm_service import LLMService
+from app.services.posts_watcher import PostsWatcher
+from app.services.rag_service import RAGService
+from app.services.upload_service import UploadService
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    应用生命周期内共享的服务实例
+    
+    在 main.py 的 lifespan 中创建一次，通过 app.api.deps 注入到各个端点。
+    RAGService / LLMService 内部的embedding客户端、LLM客户端和数据库
+    连接池因此在所有请求之间复用，不再每个请求重新构建。
+    """
+    
+    def __init__(self):
+        self.rag_service = RAGService()
+        self.llm_service = LLMService()
+        self.chat_service = ChatService(
+            rag_service=self.rag_service,
+            llm_service=self.llm_service
+        )
+        self.ingest_jobs = IngestJobManager()
+        # 上传、帖子监听和索引重建写同一份导入清单，串行执行
+        self.ingest_lock = asyncio.Lock()
+        self.upload_service = UploadService(self.rag_service, self.ingest_jobs, self.ingest_lock)
+        self.posts_watcher = PostsWatcher(self.rag_service, self.ingest_lock)
+        # 跟随其他进程完成的重建，并登记本进程正在使用的索引代际
+        self.generation_watcher = GenerationWatcher(self.rag_service)
+        logger.info("Service container initialized")
+    
+    def start(self) -> None:
+        """启动后台任务（需在事件循环中调用）"""
+        self.generation_watcher.start()
+        if settings.POSTS_WATCH_ENABLED:
+            self.posts_watcher.start()
+    
+    async def close(self) -> None:
+        """释放连接池等资源"""
+        try:
+            await self.posts_watcher.stop()
+            await self.ingest_jobs.shutdown()
+            await self.generation_watcher.stop()
+            self.upload_service.close()
+            self.rag_service.close()
+            await engine.dispose()
+            logger.info("Service container closed")
+        except Exception as e:
+            logger.error(f"Service container close error: {e}")
@@ -0,0 +1,227 @@
+"""
+文档向量缓存
+"""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 累计多少条命中后再批量写回 last_used
+_TOUCH_BATCH = 1000
+
+
+def text_hash(text: str) -> str:
+    """计算文本的sha256"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于SQLite的持久化向量缓存
+    
+    以 (model, sha256(text)) 为键保存float32向量，超过 max_entries 时按
+    最近使用时间淘汰最旧的条目。命中时的 last_used 先记在内存里，攒够
+    _TOUCH_BATCH 条或写入、淘汰前再批量更新；条目数在内存中累计，写入时
+    不再 COUNT(*) 全表（多个进程共用同一文件时是本进程视角的近似值）。
+    """
+    
+    def __init__(self, path: str, max_entries: int = 200000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used "
+            "ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 {hash: vector}"""
+        found: Dict[str, List[float]] = {}
+        if not hashes:
+            return found
+        
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite默认最多999个绑定参数
+            for i in range(0, len(unique), 900):
+                batch = unique[i:i + 900]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+            
+            if found:
+                now = time.time()
+                self._touched.update(((model, h), now) for h in found)
+                if len(self._touched) >= _TOUCH_BATCH:
+                    self._flush_touches()
+                    self._conn.commit()
+        
+        return found
+    
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """批量写入"""
+        if not items:
+            return
+        
+        now = time.time()
+        rows = [
+            (model, h, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for h, vector in items.items()
+        ]
+        with self._lock:
+            # 同一模型同一文本的向量不变，已存在（其他进程刚写入）时保留原条目
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings "
+                "(model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._rows += max(cursor.rowcount, 0)
+            self._flush_touches()
+            self._evict()
+            self._conn.commit()
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+    
+    def _flush_touches(self) -> None:
+        """把内存中攒下的命中时间写回 last_used（调用方负责commit）"""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? "
+            "WHERE model = ? AND text_hash = ?",
+            [(now, model, h) for (model, h), now in self._touched.items()]
+        )
+        self._touched.clear()
+    
+    def _evict(self) -> None:
+        """超出容量时淘汰最久未使用的条目"""
+        overflow = self._rows - self.max_entries
+        if overflow > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+            self._rows -= max(cursor.rowcount, 0)
+            logger.info(f"Embedding cache evicted {cursor.rowcount} entries")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带缓存的Embeddings包装
+    
+    embed_documents / aembed_documents 先查缓存，只把未命中的文本发给底层模型；
+    查询向量直接透传。
+    """
+    
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, cached, missing = self._lookup(texts)
+        if missing:
+            vectors = self.underlying.embed_documents([texts[i] for i in missing])
+            self._store(hashes, cached, missing, vectors)
+        return [cached[h] for h in hashes]
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SQLite读写放到线程中，不阻塞事件循环
+        hashes, cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(
+                [texts[i] for i in missing]
+            )
+            await asyncio.to_thread(self._store, hashes, cached, missing, vectors)
+        return [cached[h] for h in hashes]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+    
+    def _lookup(self, texts: List[str]):
+        """返回 (每个文本的hash, 已命中的向量, 未命中文本的下标)"""
+        hashes = [text_hash(t) for t in texts]
+        cached = self.cache.get_many(self.model, hashes)
+        
+        missing = []
+        seen = set()
+        for i, h in enumerate(hashes):
+            if h not in cached and h not in seen:
+                missing.append(i)
+                seen.add(h)
+        
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return hashes, cached, missing
+    
+    def _store(
+        self,
+        hashes: List[str],
+        cached: Dict[str, List[float]],
+        missing: List[int],
+        vectors: List[List[float]]
+    ) -> None:
+        new_items = {hashes[i]: vector for i, vector in zip(missing, vectors)}
+        self.cache.put_many(self.model, new_items)
+        cached.update(new_items)
+
+
+def create_embeddings(underlying: Embeddings, model: str) -> Embeddings:
+    """按配置为底层Embeddings套上持久化缓存"""
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return underlying
+    
+    cache = EmbeddingCache(
+        path=settings.EMBEDDING_CACHE_PATH,
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES
+    )
+    return CachedEmbeddings(underlying, cache, model)
@@ -0,0 +1,60 @@
+"""
+服务进程的索引代际跟随
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.core.config import settings
+from app.services.index_generations import process_holder, record_in_use, release_in_use
+from app.services.rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationWatcher:
+    """
+    轮询代际指针，跟随其他进程完成的重建
+    
+    scripts/init_data.py --full 等在独立进程中重建时，只改写代际指针；
+    服务进程每 INDEX_WATCH_INTERVAL 秒检查一次，指针变化后打开新代际并切换。
+    每次检查同时刷新本进程的使用登记，重建方据此等所有服务进程都切走后
+    才回收旧代际。
+    """
+    
+    def __init__(self, rag_service: RAGService, interval: Optional[float] = None):
+        self.rag_service = rag_service
+        self.interval = interval or settings.INDEX_WATCH_INTERVAL
+        self.holder = process_holder()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        release_in_use(self.holder)
+    
+    async def poll(self) -> bool:
+        """检查一次指针并刷新使用登记，返回是否切换了代际"""
+        retired = await self.rag_service.follow_active_generation()
+        await asyncio.to_thread(record_in_use, self.rag_service.generation, self.holder)
+        if retired is None:
+            return False
+        
+        # 进行中的检索用完旧索引后再释放连接池；数据由重建方回收
+        asyncio.get_running_loop().call_later(settings.INDEX_GC_DELAY, retired.release_stores)
+        logger.info(f"Following index generation {self.rag_service.generation}")
+        return True
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Generation watcher error: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,147 @@
+"""
+知识库索引代际（蓝绿切换）
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前生效代际的指针文件（位于 VECTOR_STORE_PATH 下）
+ACTIVE_FILE = "active_generation.json"
+GENERATIONS_DIR = "generations"
+# 各进程正在使用的代际（心跳文件，位于 VECTOR_STORE_PATH 下）
+IN_USE_DIR = "in_use"
+
+
+def new_generation() -> str:
+    """按时间生成新的代际名，便于从目录名看出创建时间"""
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:6]
+
+
+def active_generation() -> Optional[str]:
+    """当前生效的代际，None 表示最初未分代际的索引"""
+    path = Path(settings.VECTOR_STORE_PATH) / ACTIVE_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("generation")
+
+
+def set_active_generation(generation: Optional[str]) -> None:
+    """原子改写指针文件"""
+    path = Path(settings.VECTOR_STORE_PATH) / ACTIVE_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                "generation": generation,
+                "activated_at": datetime.now(timezone.utc).isoformat()
+            },
+            f
+        )
+    os.replace(tmp_path, path)
+
+
+def generation_path(generation: Optional[str]) -> Path:
+    """代际的本地目录：numpy索引、关键词索引和导入清单都放在这里"""
+    root = Path(settings.VECTOR_STORE_PATH)
+    return root if generation is None else root / GENERATIONS_DIR / generation
+
+
+def collection_name(base: str, generation: Optional[str]) -> str:
+    """代际对应的PGVector集合名"""
+    return base if generation is None else f"{base}_{generation}"
+
+
+def keyword_index_path(generation: Optional[str]) -> str:
+    if generation is None:
+        return settings.KEYWORD_INDEX_PATH
+    return str(generation_path(generation) / Path(settings.KEYWORD_INDEX_PATH).name)
+
+
+def manifest_path(generation: Optional[str]) -> str:
+    if generation is None:
+        return settings.INGEST_MANIFEST_PATH
+    return str(generation_path(generation) / Path(settings.INGEST_MANIFEST_PATH).name)
+
+
+def list_generations() -> List[str]:
+    """磁盘上存在的所有代际目录（含未完成或已失效的）"""
+    root = Path(settings.VECTOR_STORE_PATH) / GENERATIONS_DIR
+    if not root.exists():
+        return []
+    return sorted(child.name for child in root.iterdir() if child.is_dir())
+
+
+def remove_generation_files(generation: Optional[str]) -> None:
+    """删除代际的本地文件（向量存储自身的数据由各存储的 drop() 负责）"""
+    if generation is None:
+        for path in (settings.KEYWORD_INDEX_PATH, settings.INGEST_MANIFEST_PATH):
+            Path(path).unlink(missing_ok=True)
+    else:
+        shutil.rmtree(generation_path(generation), ignore_errors=True)
+    logger.info(f"Removed index generation files: {generation or 'default'}")
+
+
+def process_holder(suffix: str = "") -> str:
+    """本进程在使用登记中的名字（主机名 + pid，可加后缀区分用途）"""
+    holder = f"{socket.gethostname()}-{os.getpid()}"
+    return f"{holder}-{suffix}" if suffix else holder
+
+
+def record_in_use(generation: Optional[str], holder: str) -> None:
+    """
+    登记（并刷新心跳）holder 正在使用的代际
+    
+    服务进程登记正在检索的代际，重建进程登记正在写入的代际；
+    回收代际前用 generations_in_use 检查，避免删掉其他进程仍在用的索引。
+    """
+    path = Path(settings.VECTOR_STORE_PATH) / IN_USE_DIR / f"{holder}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"generation": generation}, f)
+    os.replace(tmp_path, path)
+
+
+def release_in_use(holder: str) -> None:
+    (Path(settings.VECTOR_STORE_PATH) / IN_USE_DIR / f"{holder}.json").unlink(missing_ok=True)
+
+
+def generations_in_use(exclude: Iterable[str] = ()) -> Set[Optional[str]]:
+    """
+    心跳未过期的登记中的代际
+    
+    超过 INDEX_IN_USE_TTL 秒未刷新的登记视为进程已退出，顺带删除。
+    """
+    root = Path(settings.VECTOR_STORE_PATH) / IN_USE_DIR
+    if not root.exists():
+        return set()
+    
+    excluded = set(exclude)
+    now = time.time()
+    in_use: Set[Optional[str]] = set()
+    for path in root.glob("*.json"):
+        if path.stem in excluded:
+            continue
+        try:
+            if now - path.stat().st_mtime > settings.INDEX_IN_USE_TTL:
+                path.unlink(missing_ok=True)
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                in_use.add(json.load(f).get("generation"))
+        except (OSError, ValueError):
+            # 与写入或删除并发，下次检查再读
+            continue
+    return in_use
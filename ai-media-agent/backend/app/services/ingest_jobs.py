@@ -0,0 +1,155 @@
+"""
+知识库后台导入任务
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services.ingest_pipeline import IngestProgress
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+_FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobConflictError(RuntimeError):
+    """同类的互斥任务已在运行"""
+
+
+class IngestJob:
+    """一次后台导入（重建、上传等），进度由导入流水线实时更新"""
+    
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = JOB_PENDING
+        self.progress = IngestProgress()
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED_STATES
+    
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+            "progress": self.progress.snapshot()
+        }
+
+
+class IngestJobManager:
+    """
+    后台任务登记处
+    
+    任务以 asyncio.Task 在应用事件循环中运行，HTTP请求提交后立即返回job id；
+    exclusive 的任务同一类同时只能运行一个（例如重建索引）。
+    只保留最近 max_history 个已结束任务的记录。
+    """
+    
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+    
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[IngestJob], Awaitable[bool]],
+        exclusive: bool = True
+    ) -> IngestJob:
+        """
+        提交后台任务
+        
+        Args:
+            kind: 任务类型，如 "rebuild"
+            run: 接收job并执行导入的协程函数，返回False视为失败
+            exclusive: 同类任务已在运行时拒绝提交
+        
+        Raises:
+            JobConflictError: exclusive 且同类任务正在运行
+        """
+        if exclusive:
+            running = self.running(kind)
+            if running:
+                raise JobConflictError(f"{kind} job {running[0].id} is already running")
+        
+        job = IngestJob(kind)
+        self._jobs[job.id] = job
+        job._task = asyncio.create_task(self._execute(job, run))
+        job._task.add_done_callback(lambda _: self._mark_cancelled(job))
+        self._prune()
+        logger.info(f"Ingest job submitted: {kind} {job.id}")
+        return job
+    
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+    
+    def list(self) -> List[IngestJob]:
+        """按提交时间倒序"""
+        return list(reversed(self._jobs.values()))
+    
+    def running(self, kind: Optional[str] = None) -> List[IngestJob]:
+        return [
+            job for job in self._jobs.values()
+            if not job.finished and (kind is None or job.kind == kind)
+        ]
+    
+    def cancel(self, job_id: str) -> bool:
+        """请求取消；由任务自身清理（重建会丢弃未完成的新索引，当前索引不变）"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished or job._task is None:
+            return False
+        job._task.cancel()
+        return True
+    
+    async def shutdown(self) -> None:
+        """取消所有运行中的任务并等待其退出"""
+        tasks = [job._task for job in self.running() if job._task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _execute(self, job: IngestJob, run: Callable[[IngestJob], Awaitable[bool]]) -> None:
+        job.status = JOB_RUNNING
+        try:
+            ok = await run(job)
+            job.status = JOB_SUCCEEDED if ok else JOB_FAILED
+            if not ok:
+                job.error = "ingestion reported failure, see logs"
+        except asyncio.CancelledError:
+            job.status = JOB_CANCELLED
+            logger.info(f"Ingest job cancelled: {job.kind} {job.id}")
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logger.error(f"Ingest job failed: {job.kind} {job.id}: {e}")
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+    
+    @staticmethod
+    def _mark_cancelled(job: IngestJob) -> None:
+        # 在开始执行前就被取消的任务不会进入 _execute
+        if not job.finished:
+            job.status = JOB_CANCELLED
+            job.finished_at = datetime.now(timezone.utc)
+    
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
@@ -0,0 +1,82 @@
+"""
+知识库增量导入清单
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(content: str, metadata: Optional[Dict] = None) -> str:
+    """内容 + 元数据的sha256，任一变化都需要重新导入"""
+    digest = hashlib.sha256(content.encode("utf-8"))
+    if metadata:
+        encoded = json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str)
+        digest.update(encoded.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    记录每个来源（手册章节 / Q&A条目 / 案例 / 帖子文件）已导入内容的hash
+    
+    只有写入向量存储成功后才记录，进程中途退出时未记录的来源会在
+    下次运行时重新导入，已记录的直接跳过。
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get("entries", {})
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_hash(self, source: str) -> Optional[str]:
+        entry = self._entries.get(source)
+        return entry["hash"] if entry else None
+    
+    def sources(self, source_type: str) -> List[str]:
+        """某类来源已记录的全部来源名"""
+        return [
+            source for source, entry in self._entries.items()
+            if entry.get("source_type") == source_type
+        ]
+    
+    def record(self, source: str, hash_value: str, source_type: str) -> None:
+        self._entries[source] = {
+            "hash": hash_value,
+            "source_type": source_type,
+            "ingested_at": datetime.now(timezone.utc).isoformat()
+        }
+    
+    def remove(self, source: str) -> None:
+        self._entries.pop(source, None)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def save(self) -> None:
+        """原子写入（先写临时文件再替换）"""
+        self.snapshot()()
+    
+    def snapshot(self) -> Callable[[], None]:
+        """复制当前清单，返回写入副本的函数（可在线程中执行）"""
+        path = self.path
+        entries = dict(self._entries)
+        
+        def write() -> None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": 1, "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        
+        return write
@@ -0,0 +1,261 @@
+"""
+知识库导入流水线
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.services.rag_service import split_texts
+
+logger = logging.getLogger(__name__)
+
+# (content, source, metadata)
+Item = Tuple[str, str, Dict]
+
+# 队列结束标记
+_DONE = object()
+
+
+class IngestProgress:
+    """
+    导入进度计数
+    
+    stages 中 read 按来源计数，split / embedded / written 按文档块计数；
+    sources 按来源类型记录待导入总数和已完成数，用于估算剩余时间。
+    """
+    
+    STAGES = ("read", "split", "embedded", "written")
+    
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.stages: Dict[str, int] = dict.fromkeys(self.STAGES, 0)
+        self.sources: Dict[str, Dict[str, int]] = {}
+    
+    def add_sources(self, source_type: str, count: int) -> None:
+        entry = self.sources.setdefault(source_type, {"total": 0, "done": 0})
+        entry["total"] += count
+    
+    def source_done(self, source_type: str) -> None:
+        self.sources.setdefault(source_type, {"total": 0, "done": 0})["done"] += 1
+    
+    def advance(self, stage: str, count: int = 1) -> None:
+        self.stages[stage] += count
+    
+    def snapshot(self) -> Dict:
+        """当前进度，含吞吐量（块/秒）和按来源完成速度估算的剩余秒数"""
+        elapsed = time.monotonic() - self.started_at
+        total = sum(entry["total"] for entry in self.sources.values())
+        done = sum(entry["done"] for entry in self.sources.values())
+        
+        eta = None
+        if done and total > done:
+            eta = round(elapsed / done * (total - done), 1)
+        elif total and done >= total:
+            eta = 0.0
+        
+        return {
+            "stages": dict(self.stages),
+            "sources": {key: dict(entry) for key, entry in self.sources.items()},
+            "sources_total": total,
+            "sources_done": done,
+            "elapsed_seconds": round(elapsed, 1),
+            "chunks_per_second": round(self.stages["embedded"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "eta_seconds": eta
+        }
+
+
+class IngestPipeline:
+    """
+    分阶段的异步导入流水线：读取 → 切分 → embedding → 写入
+    
+    各阶段之间是有界队列，下游处理不过来时上游自动阻塞（背压）；
+    embedding 阶段按 embed_concurrency 并发请求，写入阶段单协程串行写库。
+    以来源为单位跟踪进度，某个来源的所有块写入后回调 on_source_written。
+    传入 split_executor（进程池）时切分在池中执行，大文档切分不阻塞事件循环。
+    清洗在送入流水线之前完成（KnowledgeLoader._normalize），因为清洗结果
+    要参与清单hash的计算。
+    """
+    
+    def __init__(
+        self,
+        rag_service,
+        embed_concurrency: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        embed_semaphore: Optional[asyncio.Semaphore] = None,
+        on_source_written: Optional[Callable[[str], Awaitable[None]]] = None,
+        progress: Optional[IngestProgress] = None,
+        split_executor: Optional[Executor] = None
+    ):
+        self.rag_service = rag_service
+        self.embed_concurrency = embed_concurrency or settings.INGEST_EMBED_CONCURRENCY
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+        # 多条流水线共享同一个信号量时，embedding总并发受同一上限约束
+        self.embed_semaphore = embed_semaphore or asyncio.Semaphore(self.embed_concurrency)
+        self.on_source_written = on_source_written
+        self.progress = progress
+        self.split_executor = split_executor
+        
+        self.chunks_written = 0
+        self._pending: Dict[str, int] = {}
+        self._embed_workers = 0
+    
+    async def run(
+        self,
+        groups: Union[Iterable[Tuple[str, List[Item]]], AsyncIterable[Tuple[str, List[Item]]]]
+    ) -> int:
+        """
+        处理一批来源
+        
+        Args:
+            groups: (source, 该来源的items) 序列，可以是惰性生成器或异步生成器（读取阶段）
+        
+        Returns:
+            写入的文档块数量
+        """
+        split_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embed_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        write_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        
+        self._embed_workers = self.embed_concurrency
+        tasks = [
+            asyncio.create_task(self._read(groups, split_queue)),
+            asyncio.create_task(self._split(split_queue, embed_queue)),
+            *[
+                asyncio.create_task(self._embed(embed_queue, write_queue))
+                for _ in range(self.embed_concurrency)
+            ],
+            asyncio.create_task(self._write(write_queue))
+        ]
+        
+        # 任一阶段出错立即取消其余阶段，避免上游阻塞在已满的队列上
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        return self.chunks_written
+    
+    async def _read(self, groups, split_queue: asyncio.Queue) -> None:
+        """读取"""
+        async for source, items in iterate_groups(groups):
+            await split_queue.put((source, items))
+            self._advance("read")
+            # 生成器读取文件时让出事件循环，避免长时间占用
+            await asyncio.sleep(0)
+        await split_queue.put(_DONE)
+    
+    async def _split(self, split_queue: asyncio.Queue, embed_queue: asyncio.Queue) -> None:
+        """切分，并按token数把连续的块打包成embedding批次"""
+        batch: List[Document] = []
+        batch_tokens = 0
+        
+        while True:
+            group = await split_queue.get()
+            if group is _DONE:
+                break
+            
+            source, items = group
+            documents = await self._split_items(items)
+            
+            self._pending[source] = len(documents)
+            self._advance("split", len(documents))
+            if not documents:
+                await self._source_done(source)
+                continue
+            
+            for doc in documents:
+                tokens = self.rag_service.count_tokens(doc.page_content)
+                if batch and (
+                    batch_tokens + tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+                    or len(batch) >= settings.EMBEDDING_BATCH_MAX_ITEMS
+                ):
+                    await embed_queue.put(batch)
+                    batch, batch_tokens = [], 0
+                batch.append(doc)
+                batch_tokens += tokens
+        
+        if batch:
+            await embed_queue.put(batch)
+        # 每个embedding协程各收一个结束标记
+        for _ in range(self.embed_concurrency):
+            await embed_queue.put(_DONE)
+    
+    async def _split_items(self, items: List[Item]) -> List[Document]:
+        if self.split_executor is None:
+            documents = []
+            for content, item_source, metadata in items:
+                documents.extend(self.rag_service.split_document(content, item_source, metadata))
+            return documents
+        
+        chunk_lists = await asyncio.get_running_loop().run_in_executor(
+            self.split_executor,
+            split_texts,
+            [content for content, _, _ in items]
+        )
+        documents = []
+        for (_, item_source, metadata), chunks in zip(items, chunk_lists):
+            documents.extend(self.rag_service.chunk_documents(chunks, item_source, metadata))
+        return documents
+    
+    async def _embed(self, embed_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+        """并发计算向量"""
+        while True:
+            batch = await embed_queue.get()
+            if batch is _DONE:
+                # 最后一个退出的embedding协程通知写入阶段结束
+                self._embed_workers -= 1
+                if self._embed_workers == 0:
+                    await write_queue.put(_DONE)
+                break
+            
+            async with self.embed_semaphore:
+                embeddings = await self.rag_service.embeddings.aembed_documents(
+                    [doc.page_content for doc in batch]
+                )
+            self._advance("embedded", len(batch))
+            await write_queue.put((batch, embeddings))
+    
+    async def _write(self, write_queue: asyncio.Queue) -> None:
+        """串行写入向量存储和关键词索引"""
+        while True:
+            entry = await write_queue.get()
+            if entry is _DONE:
+                break
+            
+            batch, embeddings = entry
+            await self.rag_service.store_embedded_documents(batch, embeddings)
+            self.chunks_written += len(batch)
+            self._advance("written", len(batch))
+            
+            for doc in batch:
+                source = doc.metadata["source"]
+                self._pending[source] -= 1
+                if self._pending[source] == 0:
+                    await self._source_done(source)
+    
+    def _advance(self, stage: str, count: int = 1) -> None:
+        if self.progress is not None:
+            self.progress.advance(stage, count)
+    
+    async def _source_done(self, source: str) -> None:
+        del self._pending[source]
+        if self.on_source_written is not None:
+            await self.on_source_written(source)
+
+
+async def iterate_groups(groups):
+    """统一遍历普通可迭代对象和异步生成器"""
+    if hasattr(groups, "__aiter__"):
+        async for group in groups:
+            yield group
+    else:
+        for group in groups:
+            yield group
@@ -0,0 +1,223 @@
+"""
+BM25关键词索引
+"""
+import logging
+import math
+import os
+import pickle
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+# 中文按连续汉字切分，其余按字母数字词切分
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9]+(?:[._+#-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文感知的分词
+    
+    英文/数字按词切分（统一小写）；连续汉字切成字二元组（bigram），
+    单个汉字保留为一元组。语料以中文为主，按空格分词基本无效。
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if "\u4e00" <= run[0] <= "\u9fff":
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class KeywordIndex:
+    """
+    内存倒排索引 + BM25打分
+    
+    每个词的倒排表是两段紧凑数组（文档号 / 词频），文档号单调递增，
+    查询时直接用NumPy视图做向量化累加。删除采用墓碑标记，
+    墓碑超过1/4时整体重建。
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+    
+    def __len__(self) -> int:
+        return self._live_count
+    
+    def _reset(self) -> None:
+        self._postings: Dict[str, tuple] = {}
+        self._doc_lengths = array("I")
+        self._alive = bytearray()
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._source_docs: Dict[str, List[int]] = {}
+        self._live_count = 0
+        self._live_length = 0
+    
+    def add_documents(self, documents: List[Document]) -> None:
+        """增量添加文档块"""
+        for doc in documents:
+            doc_id = len(self._texts)
+            terms = Counter(tokenize(doc.page_content))
+            length = sum(terms.values())
+            
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = (array("I"), array("I"))
+                    self._postings[term] = postings
+                postings[0].append(doc_id)
+                postings[1].append(tf)
+            
+            self._doc_lengths.append(length)
+            self._alive.append(1)
+            self._texts.append(doc.page_content)
+            self._metadatas.append(doc.metadata)
+            source = doc.metadata.get("source")
+            if source is not None:
+                self._source_docs.setdefault(source, []).append(doc_id)
+            self._live_count += 1
+            self._live_length += length
+    
+    def delete_by_source(self, source: Union[str, List[str]], prefix: bool = False) -> int:
+        """删除某个来源（来源列表，或 prefix=True 时为来源前缀）的全部文档块"""
+        if prefix:
+            sources = [name for name in self._source_docs if name.startswith(source)]
+        elif isinstance(source, str):
+            sources = [source]
+        else:
+            sources = list(source)
+        
+        doc_ids = []
+        for name in sources:
+            doc_ids.extend(self._source_docs.pop(name, []))
+        for doc_id in doc_ids:
+            if self._alive[doc_id]:
+                self._alive[doc_id] = 0
+                self._live_count -= 1
+                self._live_length -= self._doc_lengths[doc_id]
+        
+        dead = len(self._texts) - self._live_count
+        if dead and dead * 4 >= len(self._texts):
+            self._rebuild()
+        return len(doc_ids)
+    
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """BM25检索，score越大越相关"""
+        terms = set(tokenize(query))
+        if not terms or not self._live_count or k <= 0:
+            return []
+        
+        n_docs = len(self._texts)
+        avgdl = self._live_length / self._live_count or 1.0
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            doc_ids = np.frombuffer(postings[0], dtype=np.uint32)
+            tfs = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+            
+            # 文档频率只统计未删除的文档，与 _live_count 口径一致
+            df = int(alive[doc_ids].sum())
+            if not df:
+                continue
+            idf = math.log(1 + (self._live_count - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[doc_ids] / avgdl)
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        
+        candidates = np.flatnonzero((scores > 0) & alive)
+        if filter:
+            candidates = np.array(
+                [i for i in candidates if self._match(self._metadatas[i], filter)],
+                dtype=np.int64
+            )
+        if candidates.size == 0:
+            return []
+        
+        candidate_scores = scores[candidates]
+        if k < candidates.size:
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+        else:
+            top = np.arange(candidates.size)
+        top = top[np.argsort(-candidate_scores[top])]
+        
+        return [
+            {
+                "content": self._texts[candidates[i]],
+                "metadata": self._metadatas[candidates[i]],
+                "score": float(candidate_scores[i])
+            }
+            for i in top
+        ]
+    
+    def save(self, path: str) -> None:
+        """保存到磁盘"""
+        self.snapshot(path)()
+    
+    def snapshot(self, path: str) -> Callable[[], None]:
+        """复制当前内容，返回把副本写入 path 的函数（可在线程中执行）"""
+        path = Path(path)
+        self._rebuild()
+        data = {"texts": list(self._texts), "metadatas": list(self._metadatas)}
+        
+        def write() -> None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            logger.info(f"Keyword index saved: {len(data['texts'])} chunks -> {path}")
+        
+        return write
+    
+    @classmethod
+    def load(cls, path: str) -> "KeywordIndex":
+        """从磁盘加载（倒排表按文本重新构建）"""
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        
+        index = cls()
+        index.add_documents([
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(data["texts"], data["metadatas"])
+        ])
+        logger.info(f"Keyword index loaded: {len(index)} chunks from {path}")
+        return index
+    
+    def _rebuild(self) -> None:
+        """去掉墓碑文档，重建倒排表"""
+        if self._live_count == len(self._texts):
+            return
+        
+        documents = [
+            Document(page_content=self._texts[i], metadata=self._metadatas[i])
+            for i in range(len(self._texts))
+            if self._alive[i]
+        ]
+        self._reset()
+        self.add_documents(documents)
+    
+    @staticmethod
+    def _match(metadata: Dict, filter: Dict[str, Any]) -> bool:
+        return all(str(metadata.get(key)) == str(value) for key, value in filter.items())
@@ -1,44 +1,116 @@
 """
 知识库数据加载服务
 """
+import ast
+import asyncio
 import logging
 import os
 import json
+import re
+import time
+import uuid
 import pandas as pd
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple
+from app.services.index_generations import (
+    active_generation,
+    generations_in_use,
+    list_generations,
+    manifest_path,
+    new_generation,
+    process_holder,
+    record_in_use,
+    release_in_use,
+    remove_generation_files
+)
+from app.services.ingest_manifest import IngestManifest, content_hash
+from app.services.ingest_pipeline import IngestPipeline, IngestProgress, iterate_groups
 from app.services.rag_service import RAGService
+from app.services.vector_store import drop_generation_collections
 from app.core.config import settings
+from app.db.bulk import replace_table_rows
+from app.db.models import PopularCase
+from app.utils.data_processor import DataProcessor
+from app.utils.manual_parser import ManualParser
 
 logger = logging.getLogger(__name__)
 
+# 案例导出文件中的简写列名 -> 标准列名
+_CASE_COLUMN_ALIASES = {
+    "account": "account_name",
+    "likes": "likes_count",
+    "views": "views_count",
+    "comments": "comments_count",
+    "category": "tags",
+}
+_CASE_TEXT_COLUMNS = (
+    "platform", "account_name", "content_type", "title",
+    "description", "ai_tools_used", "tags", "success_factors"
+)
+_CASE_COUNT_COLUMNS = ("likes_count", "views_count", "comments_count")
+# 计数列的格式：千分位分隔符、“1.2万”“3w”“5k”等单位写法
+_COUNT_SEPARATORS = r"[,，\s+]"
+_COUNT_PATTERN = r"^(\d+(?:\.\d+)?)(万|w|W|千|k|K|亿)?$"
+_COUNT_UNITS = {"万": 10_000, "w": 10_000, "W": 10_000, "千": 1_000, "k": 1_000, "K": 1_000, "亿": 100_000_000}
+# 列表类字段（AI工具、标签、成功要素）的分隔符；以“[”开头的按列表字面量解析
+_CASE_LIST_SEPARATOR = re.compile(r"\s*[,，、]\s*")
+
 
 class KnowledgeLoader:
-    """知识库数据加载器"""
+    """
+    知识库数据加载器
+    
+    导入是增量的：清单（IngestManifest）记录每个来源的内容hash，只有新增或
+    变化的来源会重新切分和embedding，源数据中已不存在的来源会被删除。
+    每写入 INGEST_CHECKPOINT_ITEMS 个来源，或距上次检查点超过
+    INGEST_CHECKPOINT_INTERVAL 秒，保存一次检查点；流水线出错时也会记录
+    已写入的来源，中断后重跑会从未完成的来源继续。
     
-    def __init__(self):
-        self.rag_service = RAGService()
+    各类来源并发导入，走同一套分阶段流水线（IngestPipeline），
+    embedding请求总并发受 INGEST_EMBED_CONCURRENCY 限制。
+    传入 progress 时各阶段进度会实时计入，供后台任务查询；传入
+    split_executor（进程池）时文档切分在池中执行。
+    """
+    
+    def __init__(
+        self,
+        rag_service: Optional[RAGService] = None,
+        progress: Optional[IngestProgress] = None,
+        split_executor: Optional[Executor] = None,
+        defer_case_rows: bool = False
+    ):
+        self.rag_service = rag_service or RAGService()
+        self.progress = progress
+        self.split_executor = split_executor
+        # 为真时只准备 popular_cases 的行（见 case_rows），由重建在切换时写入
+        self.defer_case_rows = defer_case_rows
+        self.case_rows: Optional[List[Dict]] = None
+        # 清单跟随索引代际，重建切换后随新索引一起生效
+        self.manifest = IngestManifest(manifest_path(self.rag_service.generation))
+        self._embed_semaphore = asyncio.Semaphore(settings.INGEST_EMBED_CONCURRENCY)
+        self._checkpoint_lock = asyncio.Lock()
     
     async def load_all(self) -> bool:
         """加载所有知识库数据"""
         try:
             logger.info("Starting knowledge base loading...")
             
-            # 1. 加载航海手册
-            await self.load_manual()
-            
-            # 2. 加载Q&A数据
-            await self.load_qa_data()
+            # 航海手册、Q&A、爆款案例、社群帖子并发导入
+            await asyncio.gather(
+                self.load_manual(),
+                self.load_qa_data(),
+                self.load_popular_cases(),
+                self.load_community_posts(),
+                self.load_uploads()
+            )
             
-            # 3. 加载爆款案例
-            await self.load_popular_cases()
-            
-            # 4. 加载社群帖子（如果有）
-            await self.load_community_posts()
+            # 持久化本地向量索引
+            self.rag_service.persist()
             
             logger.info("Knowledge base loading completed!")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Knowledge base loading failed: {e}")
             return False
@@ -53,33 +125,50 @@ class KnowledgeLoader:
             
             logger.info("Loading manual from: " + str(manual_path))
             
-            # 读取手册内容
-            with open(manual_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 按章节分割（简单实现）
-            sections = self._split_manual_by_sections(content)
-            
-            # 添加到知识库
-            for i, (title, section_content) in enumerate(sections):
-                await self.rag_service.add_document(
-                    content=section_content,
-                    source=f"航海手册-{title}",
-                    metadata={
-                        "source_type": "manual",
-                        "section_title": title,
-                        "section_index": i,
-                        "priority": "high"
-                    }
+            # 章节级粗索引随章节块一起写入，供两阶段检索先选章节
+            async def write_sections(batch):
+                await self.rag_service.add_sections([
+                    (metadata["section_title"], content, {"source": source, **metadata})
+                    for content, source, metadata in batch
+                ])
+            
+            # 在内存映射上流式解析章节，逐个切片正文送入流水线，不整体读入内存
+            with ManualParser(str(manual_path)) as parser:
+                counts = await self._sync_stream(
+                    "manual",
+                    self._manual_items(parser),
+                    on_written=write_sections
                 )
             
-            logger.info(f"Manual loaded: {len(sections)} sections")
+            logger.info(f"Manual loaded: {counts['changed'] + counts['unchanged']} sections")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Manual loading error: {e}")
             return False
     
+    def _manual_items(self, parser: ManualParser) -> Iterator[Tuple[str, str, Dict]]:
+        """逐个产出清洗后的手册章节 (content, source, metadata)"""
+        seen: Set[str] = set()
+        for i, (title, start, end) in enumerate(parser.sections()):
+            source = f"航海手册-{title}"
+            if source in seen:
+                # 流式导入时每个来源只能出现一次，重名章节用序号区分
+                source = f"{source}-{i}"
+            seen.add(source)
+            
+            item = (
+                parser.text(start, end),
+                source,
+                {
+                    "source_type": "manual",
+                    "section_title": title,
+                    "section_index": i,
+                    "priority": "high"
+                }
+            )
+            yield self._normalize([item])[0]
+    
     async def load_qa_data(self) -> bool:
         """加载Q&A数据"""
         try:
@@ -93,29 +182,40 @@ class KnowledgeLoader:
             with open(qa_path, 'r', encoding='utf-8') as f:
                 qa_data = json.load(f)
             
-            # 添加Q&A到知识库
+            # 兼容 {"qa_pairs": [...]} 格式
+            if isinstance(qa_data, dict):
+                qa_data = qa_data.get("qa_pairs", [])
+            
+            # 批量添加Q&A到知识库
+            items = []
             for i, qa in enumerate(qa_data):
                 content = f"问题：{qa['question']}\n\n答案：{qa['answer']}"
                 
-                await self.rag_service.add_document(
-                    content=content,
-                    source=f"百问百答-{i+1}",
-                    metadata={
+                items.append((
+                    content,
+                    f"百问百答-{i+1}",
+                    {
                         "source_type": "qa",
                         "category": qa.get("category", "general"),
                         "priority": "medium"
                     }
-                )
+                ))
+            await self._sync_items("qa", items)
             
             logger.info(f"Q&A data loaded: {len(qa_data)} items")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Q&A loading error: {e}")
             return False
     
     async def load_popular_cases(self) -> bool:
-        """加载爆款案例"""
+        """
+        加载爆款案例
+        
+        整列向量化处理：案例文本用pandas字符串运算一次拼出，结构化字段
+        用 COPY 批量写入 popular_cases 表，与embedding导入并发进行。
+        """
         try:
             cases_path = Path(settings.CASES_PATH)
             if not cases_path.exists():
@@ -125,27 +225,44 @@ class KnowledgeLoader:
             logger.info("Loading popular cases...")
             
             # 读取CSV数据
-            df = pd.read_csv(cases_path)
+            df = await asyncio.to_thread(lambda: self._prepare_cases(pd.read_csv(cases_path)))
             
-            for index, row in df.iterrows():
-                # 构建案例内容
-                content = self._format_case_content(row)
-                
-                await self.rag_service.add_document(
-                    content=content,
-                    source=f"爆款案例-{row.get('account_name', index)}",
-                    metadata={
+            contents = self._format_case_contents(df)
+            # 同一账号的多个案例归为一个来源；没有账号名时用行号
+            accounts = df["account_name"].astype(object).where(
+                df["account_name"].notna(), df.index.astype(str)
+            )
+            platforms = df["platform"].astype(object).where(df["platform"].notna(), None)
+            content_types = df["content_type"].astype(object).where(df["content_type"].notna(), None)
+            
+            items = [
+                (
+                    content,
+                    f"爆款案例-{account}",
+                    {
                         "source_type": "case",
-                        "platform": row.get("platform"),
-                        "content_type": row.get("content_type"),
-                        "likes_count": int(row.get("likes_count", 0)),
+                        "platform": platform,
+                        "content_type": content_type,
+                        "likes_count": likes,
                         "priority": "high"
                     }
                 )
+                for content, account, platform, content_type, likes in zip(
+                    contents.tolist(),
+                    accounts.tolist(),
+                    platforms.tolist(),
+                    content_types.tolist(),
+                    df["likes_count"].tolist()
+                )
+            ]
+            await asyncio.gather(
+                self._sync_items("case", items),
+                self._store_case_rows(df)
+            )
             
             logger.info(f"Popular cases loaded: {len(df)} items")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Cases loading error: {e}")
             return False
@@ -160,94 +277,586 @@ class KnowledgeLoader:
             
             logger.info("Loading community posts...")
             
-            post_count = 0
-            for post_file in posts_dir.glob("*.txt"):
-                with open(post_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                await self.rag_service.add_document(
-                    content=content,
-                    source=f"社群帖子-{post_file.stem}",
-                    metadata={
-                        "source_type": "post",
-                        "filename": post_file.name,
-                        "priority": "medium"
-                    }
-                )
-                post_count += 1
+            post_files = await asyncio.to_thread(lambda: list(posts_dir.glob("*.txt")))
+            items = await self._read_posts(post_files)
+            await self._sync_items("post", items)
+            post_count = len(items)
             
             logger.info(f"Community posts loaded: {post_count} items")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Community posts loading error: {e}")
             return False
     
-    def _split_manual_by_sections(self, content: str) -> List[tuple]:
-        """按章节分割手册"""
-        sections = []
-        
-        # 简单的章节分割逻辑
-        lines = content.split('\n')
-        current_section = ""
-        current_title = "开始"
-        
-        for line in lines:
-            # 检测章节标题（可以根据实际格式调整）
-            if line.startswith('##') or line.startswith('第') and ('章' in line or '节' in line):
-                # 保存上一章节
-                if current_section.strip():
-                    sections.append((current_title, current_section.strip()))
+    async def sync_post_files(self, changed: List[Path], removed: List[Path]) -> Dict[str, int]:
+        """
+        只导入新增/变化的帖子文件，并删除已不存在文件的索引（见 PostsWatcher）
+        
+        未变化的内容按清单hash跳过，mtime变化但内容相同的文件不会重新embedding。
+        """
+        items = await self._read_posts(changed)
+        result = await self._sync_items("post", items, remove_missing=False)
+        
+        sources = [f"社群帖子-{path.stem}" for path in removed]
+        sources = [source for source in sources if self.manifest.get_hash(source) is not None]
+        if sources:
+            await self._remove_sources(sources)
+        result["removed"] = len(sources)
+        return result
+    
+    async def _read_posts(self, paths: List[Path]) -> List[Tuple[str, str, Dict]]:
+        """在线程池中并行读取帖子文件并清洗"""
+        def read(path: Path) -> Optional[Tuple[str, str, Dict]]:
+            try:
+                content = path.read_text(encoding='utf-8')
+            except FileNotFoundError:
+                # 扫描之后、读取之前被删除
+                return None
+            return self._normalize([(
+                content,
+                f"社群帖子-{path.stem}",
+                {
+                    "source_type": "post",
+                    "filename": path.name,
+                    "priority": "medium"
+                }
+            )])[0]
+        
+        items = await asyncio.gather(*[asyncio.to_thread(read, path) for path in paths])
+        return [item for item in items if item is not None]
+    
+    async def load_uploads(self, paths: Optional[Iterable[Path]] = None) -> bool:
+        """
+        加载上传的文档（KNOWLEDGE_BASE_PATH/uploads，见 UploadService）
+        
+        Args:
+            paths: 只导入这些文件，不处理目录中已删除的文件；None 时同步整个目录
+        """
+        try:
+            upload_dir = Path(settings.KNOWLEDGE_BASE_PATH) / "uploads"
+            full_scan = paths is None
+            if full_scan:
+                if not upload_dir.exists():
+                    return True
+                paths = [p for p in upload_dir.iterdir() if p.is_file()]
+            paths = list(paths)
+            
+            # 大文件读取放到线程池，不阻塞事件循环
+            contents = await asyncio.gather(*[
+                asyncio.to_thread(path.read_text, encoding='utf-8', errors='replace')
+                for path in paths
+            ])
+            
+            items = []
+            for path, content in zip(paths, contents):
+                # 文件名格式：<内容hash前缀>-<原始文件名>
+                digest, _, filename = path.name.partition("-")
+                items.append((
+                    content,
+                    f"上传文档-{filename}",
+                    {
+                        "source_type": "upload",
+                        "filename": filename,
+                        "content_sha256": digest,
+                        "priority": "medium"
+                    }
+                ))
+            # 上传文件可能有数MB，清洗同样放到线程池
+            items = await asyncio.to_thread(self._normalize, items)
+            await self._sync_items("upload", items, remove_missing=full_scan)
+            
+            logger.info(f"Uploads loaded: {len(items)} files")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Uploads loading error: {e}")
+            return False
+    
+    async def _sync_items(
+        self,
+        source_type: str,
+        items: List[Tuple[str, str, Dict]],
+        on_written=None,
+        remove_missing: bool = True
+    ) -> Dict[str, int]:
+        """
+        按清单增量同步一类来源
+        
+        Args:
+            source_type: 来源类型（manual / qa / case / post / upload）
+            items: (content, source, metadata) 列表
+            on_written: 每批写入后的回调，参数为该批 items
+            remove_missing: 删除清单中有、items 中没有的来源（items 为全量时）
+        
+        Returns:
+            新增/变化、未变化、删除的来源数
+        """
+        # 同一来源的多条内容（如同一账号的多个案例）合并为一个单位计算hash
+        grouped: Dict[str, List[Tuple[str, str, Dict]]] = {}
+        for item in items:
+            grouped.setdefault(item[1], []).append(item)
+        
+        hashes = {
+            source: content_hash(
+                "\x00".join(content for content, _, _ in group),
+                {"items": [metadata for _, _, metadata in group]}
+            )
+            for source, group in grouped.items()
+        }
+        changed = [s for s, h in hashes.items() if self.manifest.get_hash(s) != h]
+        removed = [
+            s for s in self.manifest.sources(source_type)
+            if remove_missing and s not in hashes
+        ]
+        
+        if removed:
+            await self._remove_sources(removed)
+        
+        if self.progress is not None:
+            self.progress.add_sources(source_type, len(changed))
+        
+        if changed:
+            # 先删再写：覆盖旧版本，也清理上次中断时已写入但未记录的块
+            await self.rag_service.delete_by_source(changed)
+            await self._write_sources(
+                source_type,
+                ((source, grouped[source]) for source in changed),
+                hashes,
+                on_written
+            )
+        
+        logger.info(
+            f"{source_type}: {len(changed)} added/changed, "
+            f"{len(hashes) - len(changed)} unchanged, {len(removed)} removed"
+        )
+        return {
+            "changed": len(changed),
+            "unchanged": len(hashes) - len(changed),
+            "removed": len(removed)
+        }
+    
+    async def _sync_stream(
+        self,
+        source_type: str,
+        items: Iterable[Tuple[str, str, Dict]],
+        on_written=None
+    ) -> Dict[str, int]:
+        """
+        按清单增量同步一类来源，items 逐条读取
+        
+        与 _sync_items 相同，但不把所有来源读入内存：每条 item 读出后立即
+        计算hash，变化的才删除旧块并送入流水线。items 中每个来源只能出现
+        一次；items 须为全量，遍历完成后删除清单中未出现的来源（出错时不删除）。
+        
+        Returns:
+            新增/变化、未变化、删除的来源数
+        """
+        hashes: Dict[str, str] = {}
+        changed: List[str] = []
+        
+        async def changed_groups():
+            for content, source, metadata in items:
+                hashes[source] = content_hash(content, {"items": [metadata]})
+                if self.manifest.get_hash(source) == hashes[source]:
+                    continue
                 
-                # 开始新章节
-                current_title = line.strip()
-                current_section = ""
+                changed.append(source)
+                if self.progress is not None:
+                    self.progress.add_sources(source_type, 1)
+                # 先删再写：覆盖旧版本，也清理上次中断时已写入但未记录的块
+                await self.rag_service.delete_by_source(source)
+                yield source, [(content, source, metadata)]
+        
+        await self._write_sources(source_type, changed_groups(), hashes, on_written)
+        
+        removed = [s for s in self.manifest.sources(source_type) if s not in hashes]
+        if removed:
+            await self._remove_sources(removed)
+        
+        logger.info(
+            f"{source_type}: {len(changed)} added/changed, "
+            f"{len(hashes) - len(changed)} unchanged, {len(removed)} removed"
+        )
+        return {
+            "changed": len(changed),
+            "unchanged": len(hashes) - len(changed),
+            "removed": len(removed)
+        }
+    
+    async def _write_sources(
+        self,
+        source_type: str,
+        groups,
+        hashes: Dict[str, str],
+        on_written=None
+    ) -> None:
+        """
+        用流水线写入变化的来源，并按检查点把写完的来源记入清单
+        
+        Args:
+            groups: (source, 该来源的items) 的可迭代对象或异步生成器
+            hashes: 来源 -> 内容hash，写完时记入清单（异步生成器可边产出边填充）
+        """
+        written: List[str] = []
+        # 已送入流水线、尚未记入清单的来源的items，供 on_written 回调使用
+        pending: Dict[str, List[Tuple[str, str, Dict]]] = {}
+        last_checkpoint = time.monotonic()
+        
+        async def tracked():
+            async for source, items in iterate_groups(groups):
+                pending[source] = items
+                yield source, items
+        
+        async def flush():
+            nonlocal last_checkpoint
+            sources = written[:]
+            written.clear()
+            if on_written is not None:
+                await on_written([item for source in sources for item in pending[source]])
+            for source in sources:
+                pending.pop(source, None)
+                self.manifest.record(source, hashes[source], source_type)
+            await self._checkpoint()
+            last_checkpoint = time.monotonic()
+        
+        async def on_source_written(source: str):
+            written.append(source)
+            if self.progress is not None:
+                self.progress.source_done(source_type)
+            # 来源很大、写得慢时按时间也保存，中断时不会丢掉太多进度
+            if (
+                len(written) >= settings.INGEST_CHECKPOINT_ITEMS
+                or time.monotonic() - last_checkpoint >= settings.INGEST_CHECKPOINT_INTERVAL
+            ):
+                await flush()
+        
+        pipeline = IngestPipeline(
+            self.rag_service,
+            embed_semaphore=self._embed_semaphore,
+            on_source_written=on_source_written,
+            progress=self.progress,
+            split_executor=self.split_executor
+        )
+        try:
+            await pipeline.run(tracked())
+        finally:
+            # 流水线出错时也记录已写入的来源，重跑时不必重新embedding
+            if written:
+                await flush()
+    
+    def _normalize(self, items: List[Tuple[str, str, Dict]]) -> List[Tuple[str, str, Dict]]:
+        """
+        去除正文中的排版噪声
+        
+        元数据会复制到文档的每个块上，因此只记录文档的作者和原帖链接
+        （被移除的第一个作者标记 / 链接，metadata["author"] / ["link"]），
+        不保存被移除内容的完整列表。在计算清单hash之前执行，清洗规则变化时
+        受影响的来源会自动重新导入。
+        """
+        if not settings.INGEST_NORMALIZE_ENABLED:
+            return items
+        
+        normalized = []
+        for content, source, metadata in items:
+            content, removed = DataProcessor.normalize_manual_text(content)
+            extra = {
+                key: removed[plural][0]
+                for key, plural in (("author", "authors"), ("link", "links"))
+                if removed.get(plural) and key not in metadata
+            }
+            if extra:
+                metadata = {**metadata, **extra}
+            normalized.append((content, source, metadata))
+        return normalized
+    
+    async def _remove_sources(self, sources: List[str]) -> None:
+        """从索引和清单中删除来源"""
+        await self.rag_service.delete_by_source(sources)
+        for source in sources:
+            self.manifest.remove(source)
+        await self._checkpoint()
+    
+    async def _checkpoint(self) -> None:
+        """
+        先持久化索引再记录清单，保证清单中的来源一定已落盘
+        
+        在事件循环上复制索引和清单，写文件放到线程中；检查点之间串行，
+        先取的副本不会覆盖后取的。
+        """
+        async with self._checkpoint_lock:
+            write_index = self.rag_service.snapshot()
+            write_manifest = self.manifest.snapshot()
+            
+            def save():
+                write_index()
+                write_manifest()
+            
+            await asyncio.to_thread(save)
+    
+    @staticmethod
+    def _prepare_cases(df: pd.DataFrame) -> pd.DataFrame:
+        """统一列名（兼容导出文件中的简写列名），补齐缺失列，计数列转为整数（见 _parse_counts）"""
+        df = df.rename(columns={
+            alias: column for alias, column in _CASE_COLUMN_ALIASES.items()
+            if alias in df.columns and column not in df.columns
+        })
+        for column in _CASE_TEXT_COLUMNS:
+            if column not in df.columns:
+                df[column] = None
+        for column in _CASE_COUNT_COLUMNS:
+            if column in df.columns:
+                df[column] = _parse_counts(df[column], column)
             else:
-                current_section += line + '\n'
+                df[column] = 0
+        return df.reset_index(drop=True)
+    
+    @staticmethod
+    def _format_case_contents(df: pd.DataFrame) -> pd.Series:
+        """用整列字符串拼接生成所有案例的文本"""
+        def text(column: str) -> pd.Series:
+            return df[column].astype(object).where(df[column].notna(), "N/A").astype(str)
         
-        # 添加最后一个章节
-        if current_section.strip():
-            sections.append((current_title, current_section.strip()))
+        contents = (
+            "爆款案例分析\n\n"
+            + "平台：" + text("platform") + "\n"
+            + "账号：" + text("account_name") + "\n"
+            + "内容类型：" + text("content_type") + "\n"
+            + "标题：" + text("title") + "\n\n"
+            + "数据表现：\n"
+            + "- 点赞数：" + df["likes_count"].astype(str) + "\n"
+            + "- 播放量：" + df["views_count"].astype(str) + "\n"
+            + "- 评论数：" + df["comments_count"].astype(str) + "\n\n"
+            + "内容描述：\n" + text("description") + "\n\n"
+            + "使用的AI工具：\n" + text("ai_tools_used") + "\n\n"
+            + "成功要素：\n" + text("success_factors")
+        )
+        return contents.str.strip()
+    
+    async def _store_case_rows(self, df: pd.DataFrame) -> None:
+        """
+        用CSV的结构化字段整体替换 popular_cases 表（失败不影响向量导入）
+        
+        defer_case_rows 时只把行留在 case_rows 上，重建切换索引时再写入，
+        重建失败不会改动线上的表。
+        """
+        if not settings.CASES_TABLE_SYNC_ENABLED:
+            return
+        
+        try:
+            rows = await asyncio.to_thread(_case_rows, df)
+        except Exception as e:
+            logger.error(f"Popular cases table sync error: {e}")
+            return
         
-        return sections
+        if self.defer_case_rows:
+            self.case_rows = rows
+        else:
+            await self._replace_case_rows(rows)
     
-    def _format_case_content(self, case_row) -> str:
-        """格式化案例内容"""
-        content = f"""
-爆款案例分析
-
-平台：{case_row.get('platform', 'N/A')}
-账号：{case_row.get('account_name', 'N/A')}
-内容类型：{case_row.get('content_type', 'N/A')}
-标题：{case_row.get('title', 'N/A')}
+    @staticmethod
+    async def _replace_case_rows(rows: List[Dict]) -> None:
+        try:
+            await replace_table_rows(PopularCase.__table__, rows)
+        except Exception as e:
+            logger.error(f"Popular cases table sync error: {e}")
+    
+    async def rebuild_index(self, lock: Optional[asyncio.Lock] = None) -> bool:
+        """
+        重建索引（蓝绿切换）
+        
+        新索引写入独立的代际（新的PGVector集合 / 本地索引目录），重建期间
+        检索继续使用当前索引；导入完成并通过校验后原子切换。其他服务进程
+        通过代际指针跟随切换（见 GenerationWatcher），旧索引要等所有进程的
+        使用登记都切走后才回收。失败或被取消时丢弃未完成的新索引，当前索引
+        不受影响。
+        
+        Args:
+            lock: 上传和帖子监听共用的导入锁，从开始导入到切换完成一直持有，
+                重建期间写入当前索引的内容不会在切换后丢失
+        """
+        lock = lock or asyncio.Lock()
+        staging = None
+        swapped = False
+        holder = process_holder("rebuild")
+        lease = None
+        try:
+            async with lock:
+                logger.info("Rebuilding knowledge base index...")
+                await self._discard_stale_generations()
+                
+                # 登记正在写入的新代际，避免被其他进程的重建当作遗留代际回收
+                generation = new_generation()
+                lease = asyncio.create_task(self._hold_generation(generation, holder))
+                staging = self.rag_service.open_generation(generation)
+                loader = KnowledgeLoader(
+                    staging,
+                    progress=self.progress,
+                    split_executor=self.split_executor,
+                    defer_case_rows=True
+                )
+                loader._embed_semaphore = self._embed_semaphore
+                if not await loader.load_all():
+                    raise RuntimeError("loading into the new index failed")
+                
+                await self._validate_generation(staging)
+                retired = self.rag_service.swap_generation(staging)
+                swapped = True
+                self.manifest = loader.manifest
+                if loader.case_rows is not None:
+                    await self._replace_case_rows(loader.case_rows)
+                logger.info(f"Index rebuilt as generation {staging.generation}")
+            
+            # 等进行中的检索用完旧索引、其他服务进程切走后再回收
+            await asyncio.sleep(settings.INDEX_GC_DELAY)
+            await self._discard_when_unused(retired)
+            return True
+        
+        except Exception as e:
+            logger.error(f"Index rebuild error: {e}")
+            return False
+        
+        finally:
+            if lease is not None:
+                lease.cancel()
+                release_in_use(holder)
+            if staging is not None and not swapped:
+                await self.rag_service.discard_generation(staging)
+    
+    @staticmethod
+    async def _hold_generation(generation: str, holder: str) -> None:
+        """重建期间定期刷新新代际的使用登记"""
+        while True:
+            await asyncio.to_thread(record_in_use, generation, holder)
+            await asyncio.sleep(settings.INDEX_WATCH_INTERVAL)
+    
+    async def _discard_when_unused(self, retired: RAGService) -> None:
+        """
+        等没有其他进程登记使用旧代际后再回收
+        
+        本进程已切换，自身的登记不计入。等待 INDEX_IN_USE_TTL 秒后仍有进程
+        在用时只释放连接池，数据留给之后的重建作为遗留代际回收。
+        """
+        deadline = time.monotonic() + settings.INDEX_IN_USE_TTL
+        while retired.generation in generations_in_use(exclude=[process_holder()]):
+            if time.monotonic() >= deadline:
+                logger.warning(
+                    f"Index generation {retired.generation} is still in use by another process, "
+                    f"leaving it for a later rebuild to collect"
+                )
+                retired.release_stores()
+                return
+            await asyncio.sleep(settings.INDEX_WATCH_INTERVAL)
+        await self.rag_service.discard_generation(retired)
+    
+    async def _validate_generation(self, staging: RAGService) -> None:
+        """新索引不能为空，且块数不能比当前索引少太多（源数据缺失时避免切换）"""
+        new_chunks = (await staging.get_stats()).get("total_chunks", 0)
+        current_chunks = (await self.rag_service.get_stats()).get("total_chunks", 0)
+        
+        if new_chunks == 0:
+            raise RuntimeError("new index is empty")
+        if new_chunks < current_chunks * settings.INDEX_SWAP_MIN_RATIO:
+            raise RuntimeError(
+                f"new index has {new_chunks} chunks, "
+                f"below {settings.INDEX_SWAP_MIN_RATIO:.0%} of current {current_chunks}"
+            )
+    
+    async def _discard_stale_generations(self) -> None:
+        """
+        回收遗留的代际（上次重建中断留下的、或切换后未能及时回收的）
+        
+        按集合名直接删除，不打开集合；生效中的、本进程正在用的以及其他进程
+        登记使用（检索或正在重建）的代际不回收。
+        """
+        keep = generations_in_use() | {active_generation(), self.rag_service.generation}
+        stale = [generation for generation in list_generations() if generation not in keep]
+        if not stale:
+            return
+        
+        try:
+            logger.info(f"Discarding stale index generations: {', '.join(stale)}")
+            await asyncio.to_thread(drop_generation_collections, stale)
+            for generation in stale:
+                remove_generation_files(generation)
+        except Exception as e:
+            logger.warning(f"Failed to discard stale index generations: {e}")
 
-数据表现：
-- 点赞数：{case_row.get('likes_count', 0)}
-- 播放量：{case_row.get('views_count', 0)}
-- 评论数：{case_row.get('comments_count', 0)}
 
-内容描述：
-{case_row.get('description', 'N/A')}
+def _parse_counts(values: pd.Series, column: str) -> pd.Series:
+    """
+    把计数列解析为整数
+    
+    去掉千分位分隔符，按单位换算（"1,200" -> 1200，"1.2万" -> 12000，"5k" -> 5000）；
+    缺失值记为0，其余无法解析的值也记为0并打印警告。
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.fillna(0).round().astype("int64")
+    
+    missing = values.isna()
+    text = values.astype(str).str.replace(_COUNT_SEPARATORS, "", regex=True)
+    parts = text.str.extract(_COUNT_PATTERN)
+    numbers = pd.to_numeric(parts[0], errors="coerce")
+    units = parts[1].map(_COUNT_UNITS).fillna(1)
+    counts = (numbers * units).round()
+    
+    invalid = counts.isna() & ~missing & (text != "")
+    if invalid.any():
+        examples = values[invalid].astype(str).unique()[:3].tolist()
+        logger.warning(f"{column}: {int(invalid.sum())} unparseable values set to 0, e.g. {examples}")
+    return counts.fillna(0).astype("int64")
 
-使用的AI工具：
-{case_row.get('ai_tools_used', 'N/A')}
 
-成功要素：
-{case_row.get('success_factors', 'N/A')}
-"""
-        return content.strip()
+def _parse_case_list(value: str) -> Optional[List[str]]:
+    """
+    解析列表类字段
     
-    async def rebuild_index(self) -> bool:
-        """重建索引"""
+    "['ChatGPT', 'Gamma']" 这类列表字面量按字面量解析，其余按分隔符拆分；
+    空列表记为 None。
+    """
+    value = value.strip()
+    parts = None
+    if value.startswith("["):
         try:
-            logger.info("Rebuilding knowledge base index...")
-            
-            # 清空现有数据
-            # TODO: 实现清空逻辑
-            
-            # 重新加载所有数据
-            return await self.load_all()
-            
-        except Exception as e:
-            logger.error(f"Index rebuild error: {e}")
-            return False
\ No newline at end of file
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed = None
+        if isinstance(parsed, (list, tuple)):
+            parts = [str(p).strip() for p in parsed if p is not None]
+    if parts is None:
+        parts = _CASE_LIST_SEPARATOR.split(value)
+    return [p for p in parts if p] or None
+
+
+def _case_rows(df: pd.DataFrame) -> List[Dict]:
+    """把案例表转换为 popular_cases 的行（按列批量转换，不逐行访问DataFrame）"""
+    def strings(column: str, length: Optional[int] = None) -> List[Optional[str]]:
+        # 按列的长度上限截断，缺失值写NULL
+        missing = df[column].isna().tolist()
+        values = df[column].astype(str).str.slice(0, length).tolist()
+        return [None if m else v for v, m in zip(values, missing)]
+    
+    def lists(column: str) -> List[Optional[List[str]]]:
+        return [_parse_case_list(value) for value in df[column].fillna("").astype(str)]
+    
+    dates = pd.to_datetime(df["publish_date"], errors="coerce") if "publish_date" in df.columns else None
+    columns = {
+        "id": [uuid.uuid4() for _ in range(len(df))],
+        "platform": [p or "unknown" for p in strings("platform", 50)],
+        "account_name": strings("account_name", 100),
+        "content_type": strings("content_type", 50),
+        "title": strings("title", 255),
+        "description": strings("description"),
+        "likes_count": df["likes_count"].tolist(),
+        "views_count": df["views_count"].tolist(),
+        "comments_count": df["comments_count"].tolist(),
+        "publish_date": (
+            [None if pd.isna(d) else d.to_pydatetime() for d in dates]
+            if dates is not None else [None] * len(df)
+        ),
+        "ai_tools_used": lists("ai_tools_used"),
+        "tags": lists("tags"),
+        "success_factors": lists("success_factors")
+    }
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
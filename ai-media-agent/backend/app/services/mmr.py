@@ -0,0 +1,55 @@
+"""
+最大边际相关性（MMR）重排
+"""
+from typing import List
+
+import numpy as np
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int = 5,
+    lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    从候选集中选出兼顾相关性与多样性的 k 个结果
+    
+    候选之间的相似度一次矩阵乘法算出；贪心选择时维护每个候选与已选集合的
+    最大相似度，每选一个只用它那一行做一次向量化的 maximum 更新。
+    
+    Args:
+        query: 查询向量
+        candidates: 候选向量矩阵（n x d），按相关性从高到低排列
+        k: 选取数量
+        lambda_mult: 相关性权重，1为纯相关性排序，0为纯多样性
+    
+    Returns:
+        选中候选的下标，按选择顺序排列
+    """
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    
+    vectors = np.asarray(candidates, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    
+    return selected
@@ -0,0 +1,100 @@
+"""
+社群帖子目录监听
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.knowledge_loader import KnowledgeLoader
+from app.services.rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+# 文件名 -> (mtime_ns, size)
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+class PostsWatcher:
+    """
+    轮询 KNOWLEDGE_BASE_PATH/posts，增量导入新增/修改/删除的帖子
+    
+    每 POSTS_WATCH_INTERVAL 秒扫描一次目录，按 (mtime, size) 与上次扫描比较，
+    只读取和导入变化的文件；文件内容再按清单hash比较，内容未变的不会重新
+    embedding。只依赖 os.scandir，不需要平台相关的文件通知接口。
+    
+    首次扫描以及索引代际切换（重建）后做一次全量同步，补上服务停止期间
+    或重建期间的变化。
+    """
+    
+    def __init__(
+        self,
+        rag_service: RAGService,
+        lock: Optional[asyncio.Lock] = None,
+        interval: Optional[float] = None
+    ):
+        self.rag_service = rag_service
+        # 与其他导入任务共用一把锁，避免并发写同一份导入清单
+        self.lock = lock or asyncio.Lock()
+        self.interval = interval or settings.POSTS_WATCH_INTERVAL
+        self.posts_dir = Path(settings.KNOWLEDGE_BASE_PATH) / "posts"
+        self._snapshot: Optional[Snapshot] = None
+        self._generation: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Watching {self.posts_dir} every {self.interval}s")
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def poll(self) -> Dict[str, int]:
+        """扫描一次并导入变化，返回新增/变化、删除的文件数"""
+        snapshot = await asyncio.to_thread(self._scan)
+        
+        async with self.lock:
+            loader = KnowledgeLoader(self.rag_service)
+            if self._snapshot is None or self._generation != self.rag_service.generation:
+                if not await loader.load_community_posts():
+                    raise RuntimeError("full posts sync failed")
+                self._snapshot = snapshot
+                self._generation = self.rag_service.generation
+                return {"changed": len(snapshot), "removed": 0}
+            
+            changed = [
+                self.posts_dir / name for name, stat in snapshot.items()
+                if self._snapshot.get(name) != stat
+            ]
+            removed = [self.posts_dir / name for name in self._snapshot if name not in snapshot]
+            if changed or removed:
+                await loader.sync_post_files(changed, removed)
+                logger.info(f"Posts watcher: {len(changed)} changed, {len(removed)} removed")
+            self._snapshot = snapshot
+            return {"changed": len(changed), "removed": len(removed)}
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                # 单次失败不停止监听，下一轮按旧快照重试
+                logger.error(f"Posts watcher error: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def _scan(self) -> Snapshot:
+        snapshot: Snapshot = {}
+        if not self.posts_dir.exists():
+            return snapshot
+        with os.scandir(self.posts_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".txt"):
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
@@ -0,0 +1,74 @@
+"""
+检索结果缓存
+"""
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class QueryCache:
+    """
+    LRU + TTL 检索结果缓存
+    
+    知识库每次写入/删除都会递增 generation，旧 generation 下的结果不再命中；
+    检索开始前记下 generation，写回时若已变化则丢弃，避免把写入期间
+    查到的旧结果缓存下来。
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+    
+    @staticmethod
+    def make_key(kind: str, query: str, **params: Any) -> Hashable:
+        """按规范化后的查询和参数生成缓存键"""
+        normalized = " ".join(query.lower().split())
+        return (kind, normalized, json.dumps(params, sort_keys=True, ensure_ascii=False))
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, generation, value = entry
+        if generation != self.generation or expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+    
+    def set(self, key: Hashable, value: Any, generation: int) -> None:
+        """写入缓存；generation 为检索开始时的值"""
+        if generation != self.generation or self.max_entries <= 0:
+            return
+        
+        self._entries[key] = (time.monotonic() + self.ttl, generation, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self) -> None:
+        """知识库发生变化，使全部缓存失效"""
+        self.generation += 1
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "generation": self.generation
+        }
@@ -0,0 +1,123 @@
+"""
+查询向量缓存与微批处理
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingBatcher:
+    """
+    查询向量LRU缓存 + 微批合并
+    
+    在 max_wait 秒窗口内到达的查询合并成一次 aembed_documents 请求，
+    结果再分发给各个等待的协程；相同文本的并发请求共享同一个Future。
+    每次请求最多 max_batch 条，攒满时立即发出；批量请求失败时逐条重试，
+    只有出错的文本对应的调用方收到异常。
+    """
+    
+    def __init__(
+        self,
+        embeddings,
+        max_wait: float = 0.005,
+        max_batch: int = 64,
+        cache_size: int = 4096
+    ):
+        self.embeddings = embeddings
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_handle = None
+        self._tasks = set()
+        
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.embedded = 0
+    
+    async def embed(self, text: str) -> List[float]:
+        """获取查询向量"""
+        vector = self._cache.get(text)
+        if vector is not None:
+            self._cache.move_to_end(text)
+            self.hits += 1
+            return vector
+        
+        self.misses += 1
+        future = self._pending.get(text)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[text] = future
+            
+            if len(self._pending) >= self.max_batch:
+                # 立即取走当前批次，之后到达的查询进入下一批
+                self._start_flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.max_wait, self._start_flush)
+        
+        # shield: 某个调用方被取消时不影响同批次的其他等待者
+        return await asyncio.shield(future)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "batches": self.batches,
+            "embedded": self.embedded
+        }
+    
+    def _start_flush(self) -> None:
+        """取走当前批次并发出请求"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch = self._pending
+        self._pending = {}
+        if not batch:
+            return
+        
+        # 保留任务引用，避免执行中被垃圾回收
+        task = asyncio.ensure_future(self._flush(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _flush(self, batch: Dict[str, asyncio.Future]) -> None:
+        """把一个批次发给embedding接口"""
+        texts = list(batch)
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as e:
+            if len(texts) > 1:
+                # 逐条重试，一条文本出错不影响同批次的其他查询
+                logger.warning(f"Query embedding batch of {len(texts)} failed, retrying one by one: {e}")
+                await asyncio.gather(*[
+                    self._flush({text: future}) for text, future in batch.items()
+                ])
+                return
+            logger.error(f"Query embedding error: {e}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        self.batches += 1
+        self.embedded += len(texts)
+        for text, vector in zip(texts, vectors):
+            self._remember(text, vector)
+            future = batch[text]
+            if not future.done():
+                future.set_result(vector)
+    
+    def _remember(self, text: str, vector: List[float]) -> None:
+        self._cache[text] = vector
+        self._cache.move_to_end(text)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -1,14 +1,38 @@
 """
 RAG服务核心实现
 """
+import asyncio
+import copy
+import heapq
 import logging
-from typing import List, Dict, Optional
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Dict, Optional, Tuple, Union
+import numpy as np
+import tiktoken
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores.pgvector import PGVector
 from langchain.schema import Document
 from app.core.config import settings
 from app.db.models import KnowledgeChunk
+from app.services.embedding_cache import create_embeddings
+from app.services.index_generations import (
+    active_generation,
+    keyword_index_path,
+    remove_generation_files,
+    set_active_generation
+)
+from app.services.keyword_index import KeywordIndex
+from app.services.mmr import maximal_marginal_relevance
+from app.services.query_cache import QueryCache
+from app.services.query_embedder import QueryEmbeddingBatcher
+from app.services.vector_store import (
+    create_section_store,
+    create_vector_store,
+    is_local_store,
+    source_type_for
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,29 +41,61 @@ class RAGService:
     """RAG检索增强生成服务"""
     
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
+        # 文档向量先查本地缓存，未变化的文本不会重复请求embedding接口
+        base_embeddings = OpenAIEmbeddings(
             model=settings.EMBEDDING_MODEL,
             openai_api_key=settings.OPENAI_API_KEY
         )
+        self.embeddings = create_embeddings(
+            base_embeddings,
+            model=settings.EMBEDDING_MODEL
+        )
         
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?"]
+        # 查询向量走独立的LRU缓存，并把并发查询合并成批量请求
+        self.query_embedder = QueryEmbeddingBatcher(
+            base_embeddings,
+            max_wait=settings.QUERY_EMBED_BATCH_WAIT,
+            max_batch=settings.QUERY_EMBED_BATCH_SIZE,
+            cache_size=settings.QUERY_EMBED_CACHE_SIZE
         )
         
-        # 初始化向量存储
-        self.vector_store = PGVector(
-            connection_string=settings.DATABASE_URL,
-            embedding_function=self.embeddings,
-            collection_name="knowledge_base"
+        self.text_splitter = create_text_splitter()
+        
+        self._tokenizer = self._load_tokenizer()
+        
+        # 当前生效的索引代际（重建时新代际建好后整体切换，见 swap_generation）
+        self.generation = active_generation()
+        
+        # 初始化向量存储（pgvector / numpy，见 VECTOR_STORE_BACKEND）
+        self.vector_store = create_vector_store(self.embeddings, self.generation)
+        
+        # 手册章节级粗索引，用于两阶段检索
+        self.section_store = create_section_store(self.embeddings, self.generation)
+        
+        # BM25关键词索引（内存倒排表，随写入/删除增量更新）
+        self.keyword_index = self._load_keyword_index(
+            keyword_index_path(self.generation), self.vector_store
         )
+        
+        # 检索结果缓存，知识库变更时整体失效
+        self.query_cache = QueryCache(
+            max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+            ttl=settings.QUERY_CACHE_TTL
+        )
+        self._stats_cache = None
     
     async def search(
         self, 
         query: str, 
         k: int = 5,
-        filter_source: Optional[str] = None
+        filter_source: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[Dict[str, str]] = None,
+        mmr: Optional[bool] = None,
+        lambda_mult: Optional[float] = None,
+        neighbors: Optional[int] = None,
+        sections: Optional[int] = None
     ) -> List[Dict]:
         """
         搜索相关文档
@@ -48,22 +104,66 @@ class RAGService:
             query: 查询文本
             k: 返回结果数量
             filter_source: 过滤来源
-            
+            ef_search: HNSW查询候选数（越大召回越高、越慢），默认取配置
+            probes: IVFFlat探测聚类数，默认取配置
+            filters: 元数据过滤，如 {"source_type": "case", "platform": "抖音"}
+            mmr: 是否用MMR从 k * MMR_FETCH_MULTIPLIER 个候选中选出多样化的k个，默认取配置
+            lambda_mult: MMR相关性权重（0~1，越小越多样），默认取配置
+            neighbors: 每个命中块前后各扩展的相邻块数，扩展后同一来源的连续块
+                合并成一段，默认取 NEIGHBOR_CHUNKS
+            sections: 两阶段检索：先在章节粗索引中选出前 sections 个手册章节，
+                手册块只在这些章节内检索，其他来源照常检索，默认取
+                SECTION_SEARCH_TOP（0为不启用；指定了过滤条件时不启用）
+        
         Returns:
             相关文档列表
         """
+        ef_search = ef_search or settings.VECTOR_INDEX_EF_SEARCH
+        probes = probes or settings.VECTOR_INDEX_PROBES
+        mmr = settings.MMR_ENABLED if mmr is None else mmr
+        lambda_mult = settings.MMR_LAMBDA if lambda_mult is None else lambda_mult
+        neighbors = settings.NEIGHBOR_CHUNKS if neighbors is None else neighbors
+        sections = settings.SECTION_SEARCH_TOP if sections is None else sections
+        if filter_source or filters:
+            # 章节只用于缩小无过滤检索中的手册候选
+            sections = 0
+        
+        cache_key = self.query_cache.make_key(
+            "search", query, k=k, filter=filter_source, filters=filters,
+            ef_search=ef_search, probes=probes,
+            mmr=lambda_mult if mmr else None, neighbors=neighbors,
+            sections=sections
+        )
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = self.query_cache.generation
+        
         try:
             # 构建过滤器
-            filter_dict = {}
+            filter_dict = dict(filters or {})
             if filter_source:
                 filter_dict["source"] = filter_source
             
             # 相似度搜索
-            results = await self.vector_store.asimilarity_search_with_score(
-                query=query,
-                k=k,
-                filter=filter_dict
-            )
+            embedding = await self.query_embedder.embed(query)
+            if mmr:
+                # 多取候选，再按MMR去掉内容重叠的相邻块
+                candidates = await self._search_candidates(
+                    embedding, k * settings.MMR_FETCH_MULTIPLIER, filter_dict, sections,
+                    ef_search=ef_search, probes=probes, return_embeddings=True
+                )
+                selected = maximal_marginal_relevance(
+                    np.asarray(embedding, dtype=np.float32),
+                    np.stack([c[2] for c in candidates]) if candidates else np.zeros((0, 0)),
+                    k=k,
+                    lambda_mult=lambda_mult
+                )
+                results = [candidates[i][:2] for i in selected]
+            else:
+                results = await self._search_candidates(
+                    embedding, k, filter_dict, sections, ef_search=ef_search, probes=probes
+                )
             
             # 格式化结果
             formatted_results = []
@@ -74,13 +174,156 @@ class RAGService:
                     "score": float(score)
                 })
             
+            if neighbors > 0:
+                formatted_results = await self._expand_neighbors(formatted_results, neighbors)
+            
             logger.info(f"Found {len(formatted_results)} relevant documents")
+            self.query_cache.set(cache_key, formatted_results, generation)
             return formatted_results
-            
+        
         except Exception as e:
             logger.error(f"Search error: {e}")
             return []
     
+    async def _expand_neighbors(self, results: List[Dict], window: int) -> List[Dict]:
+        """
+        相邻块扩展
+        
+        一次批量查询取出命中块前后 window 个块，同一来源中相互重叠或相邻的
+        范围合并为一段连续文本（去掉块之间的重叠部分），段落按其中最好的
+        命中分数排序。
+        """
+        # 每个来源的命中范围：[start, end, 最佳命中]
+        spans: Dict[str, List[List]] = {}
+        passthrough = []
+        for result in results:
+            metadata = result["metadata"]
+            if "chunk_index" not in metadata or "source" not in metadata:
+                passthrough.append(result)
+                continue
+            index = int(metadata["chunk_index"])
+            last = int(metadata.get("total_chunks", index + window + 1)) - 1
+            spans.setdefault(metadata["source"], []).append(
+                [max(index - window, 0), min(index + window, last), result]
+            )
+        
+        merged: List[Tuple[str, int, int, Dict]] = []
+        for source, ranges in spans.items():
+            ranges.sort(key=lambda r: r[0])
+            current = ranges[0]
+            for start, end, best in ranges[1:]:
+                if start <= current[1] + 1:
+                    current[1] = max(current[1], end)
+                    if best["score"] < current[2]["score"]:
+                        current[2] = best
+                else:
+                    merged.append((source, *current))
+                    current = [start, end, best]
+            merged.append((source, *current))
+        
+        keys = [
+            (source, index)
+            for source, start, end, _ in merged
+            for index in range(start, end + 1)
+        ]
+        if is_local_store(self.vector_store):
+            documents = self.vector_store.get_chunks(keys)
+        else:
+            documents = await asyncio.get_running_loop().run_in_executor(
+                None, self.vector_store.get_chunks, keys
+            )
+        chunks = {
+            (doc.metadata["source"], int(doc.metadata["chunk_index"])): doc.page_content
+            for doc in documents
+        }
+        
+        passages = []
+        for source, start, end, best in merged:
+            texts = [chunks[(source, i)] for i in range(start, end + 1) if (source, i) in chunks]
+            metadata = dict(best["metadata"])
+            metadata["chunk_range"] = [start, end]
+            passages.append({
+                "content": _stitch_chunks(texts) if texts else best["content"],
+                "metadata": metadata,
+                "score": best["score"]
+            })
+        
+        # score是距离，越小越相关
+        passages.sort(key=lambda p: p["score"])
+        return passages + passthrough
+    
+    async def _search_candidates(
+        self,
+        embedding: List[float],
+        k: int,
+        filter_dict: Dict,
+        sections: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        return_embeddings: bool = False
+    ) -> List[Tuple]:
+        """
+        检索候选块，sections > 0 时先按章节粗索引缩小手册候选
+        
+        两阶段检索分两路执行：手册块只在选中的章节内检索，另一路只检索非手册
+        来源（source_type 排除 manual），两路合起来每个向量只比较一次，按距离合并。
+        """
+        search = lambda flt: self._search_by_vector(
+            embedding, k, flt, ef_search=ef_search, probes=probes,
+            return_embeddings=return_embeddings
+        )
+        if sections <= 0:
+            return await search(filter_dict)
+        
+        section_hits = await self._search_by_vector(
+            embedding, sections, {}, store=self.section_store
+        )
+        if not section_hits:
+            return await search(filter_dict)
+        
+        selected = {doc.metadata["source"] for doc, _ in section_hits}
+        manual_results, results = await asyncio.gather(
+            search({**filter_dict, "source": sorted(selected)}),
+            search({**filter_dict, "source_type": {"$nin": ["manual"]}})
+        )
+        
+        merged: Dict[tuple, Tuple] = {}
+        for result in manual_results + results:
+            metadata = result[0].metadata
+            # 缺少 source_type 的旧手册块不会被排除条件过滤掉
+            if _is_manual(metadata) and metadata.get("source") not in selected:
+                continue
+            key = self._chunk_key({"content": result[0].page_content, "metadata": metadata})
+            merged.setdefault(key, result)
+        # score是距离，越小越相关
+        return heapq.nsmallest(k, merged.values(), key=lambda item: item[1])
+    
+    async def _search_by_vector(
+        self,
+        embedding: List[float],
+        k: int,
+        filter_dict: Dict,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        return_embeddings: bool = False,
+        store=None
+    ) -> List[Tuple]:
+        """按向量检索（默认检索块索引）"""
+        store = self.vector_store if store is None else store
+        if is_local_store(store):
+            return store.similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter_dict, return_embeddings=return_embeddings
+            )
+        
+        # PGVector的查询是同步的，放到线程池避免阻塞事件循环
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: store.similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter_dict, ef_search=ef_search, probes=probes,
+                return_embeddings=return_embeddings
+            )
+        )
+    
     async def add_document(
         self, 
         content: str, 
@@ -94,74 +337,410 @@ class RAGService:
             content: 文档内容
             source: 文档来源
             metadata: 额外元数据
-            
+        
         Returns:
             是否成功
         """
         try:
             # 分割文档
-            chunks = self.text_splitter.split_text(content)
-            
-            # 创建Document对象
-            documents = []
-            for i, chunk in enumerate(chunks):
-                doc_metadata = {
-                    "source": source,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
-                }
-                if metadata:
-                    doc_metadata.update(metadata)
-                
-                documents.append(Document(
-                    page_content=chunk,
-                    metadata=doc_metadata
-                ))
+            documents = self.split_document(content, source, metadata)
             
             # 添加到向量存储
             await self.vector_store.aadd_documents(documents)
+            self.keyword_index.add_documents(documents)
+            self.query_cache.invalidate()
+            self._stats_cache = None
             
             logger.info(f"Added {len(documents)} chunks from {source}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Add document error: {e}")
             return False
     
-    async def delete_by_source(self, source: str) -> bool:
+    async def add_documents_bulk(
+        self,
+        items: List[Tuple[str, str, Optional[Dict]]]
+    ) -> int:
         """
-        根据来源删除文档
+        批量添加文档到知识库
+        
+        所有文档先统一分块，再按token数打包成embedding批次，
+        最后一次性写入向量存储。
         
         Args:
-            source: 文档来源
+            items: (content, source, metadata) 列表
+        
+        Returns:
+            写入的文档块数量，失败时为0
+        """
+        try:
+            # 分割所有文档
+            documents = []
+            for content, source, metadata in items:
+                documents.extend(self.split_document(content, source, metadata))
+            
+            if not documents:
+                return 0
+            
+            # 按token数分批计算向量
+            texts = [doc.page_content for doc in documents]
+            embeddings = []
+            for start, end in self._token_batches(texts):
+                embeddings.extend(
+                    await self.embeddings.aembed_documents(texts[start:end])
+                )
+            
+            # 一次性写入向量存储
+            await self.store_embedded_documents(documents, embeddings)
+            
+            logger.info(f"Bulk added {len(documents)} chunks from {len(items)} documents")
+            return len(documents)
+        
+        except Exception as e:
+            logger.error(f"Bulk add documents error: {e}")
+            return 0
+    
+    async def store_embedded_documents(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]]
+    ) -> None:
+        """写入已计算好向量的文档块（向量存储 + 关键词索引），并使缓存失效"""
+        await self._write_embeddings(
+            [doc.page_content for doc in documents],
+            embeddings,
+            [doc.metadata for doc in documents]
+        )
+        self.keyword_index.add_documents(documents)
+        self.query_cache.invalidate()
+        self._stats_cache = None
+    
+    def split_document(
+        self,
+        content: str,
+        source: str,
+        metadata: Optional[Dict] = None
+    ) -> List[Document]:
+        """分割文档并附加块元数据"""
+        return self.chunk_documents(self.text_splitter.split_text(content), source, metadata)
+    
+    @staticmethod
+    def chunk_documents(
+        chunks: List[str],
+        source: str,
+        metadata: Optional[Dict] = None
+    ) -> List[Document]:
+        """把已切好的文本块包装成带块元数据的文档"""
+        ingested_at = datetime.now(timezone.utc).isoformat()
+        
+        documents = []
+        for i, chunk in enumerate(chunks):
+            doc_metadata = {
+                "source": source,
+                "chunk_index": i,
+                "total_chunks": len(chunks),
+                "ingested_at": ingested_at
+            }
+            if metadata:
+                doc_metadata.update(metadata)
+            
+            documents.append(Document(
+                page_content=chunk,
+                metadata=doc_metadata
+            ))
+        return documents
+    
+    def _token_batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """按token数和条数上限把文本切成连续批次，返回 (start, end) 列表"""
+        batches = []
+        start = 0
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if i > start and (
+                batch_tokens + tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+                or i - start >= settings.EMBEDDING_BATCH_MAX_ITEMS
+            ):
+                batches.append((start, i))
+                start = i
+                batch_tokens = 0
+            batch_tokens += tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+    
+    def count_tokens(self, text: str) -> int:
+        """统计token数；tiktoken不可用时按字符数估算（中文约1字1token）"""
+        if self._tokenizer is None:
+            return len(text)
+        return len(self._tokenizer.encode(text, disallowed_special=()))
+    
+    @staticmethod
+    def _load_tokenizer():
+        """加载embedding模型对应的tokenizer（离线环境下可能无法下载词表）"""
+        try:
+            try:
+                return tiktoken.encoding_for_model(settings.EMBEDDING_MODEL)
+            except KeyError:
+                return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable, falling back to char count: {e}")
+            return None
+    
+    async def _write_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict],
+        store=None
+    ) -> None:
+        """把已计算的向量写入向量存储（默认写块索引）"""
+        store = self.vector_store if store is None else store
+        if is_local_store(store):
+            store.add_embeddings(texts, embeddings, metadatas)
+        else:
+            # PGVector的批量写入是同步的，放到线程池避免阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: store.add_embeddings(
+                    texts=texts,
+                    embeddings=embeddings,
+                    metadatas=metadatas
+                )
+            )
+    
+    async def add_sections(self, sections: List[Tuple[str, str, Dict]]) -> int:
+        """
+        写入章节级粗索引
+        
+        Args:
+            sections: (章节标题, 章节内容, 元数据) 列表，元数据中的 source
+                须与该章节块的 source 一致
+        
+        Returns:
+            写入的章节数
+        """
+        if not sections:
+            return 0
+        
+        try:
+            # 章节向量 = 标题 + 开头一段内容作为摘要
+            texts = [
+                f"{title}\n{content[:settings.SECTION_SUMMARY_CHARS]}"
+                for title, content, _ in sections
+            ]
+            metadatas = [dict(metadata) for _, _, metadata in sections]
+            embeddings = await self.embeddings.aembed_documents(texts)
+            await self._write_embeddings(texts, embeddings, metadatas, store=self.section_store)
             
+            self.query_cache.invalidate()
+            logger.info(f"Section index updated: {len(sections)} sections")
+            return len(sections)
+        
+        except Exception as e:
+            logger.error(f"Add sections error: {e}")
+            return 0
+    
+    async def delete_by_source(self, source: Union[str, List[str]], prefix: bool = False) -> bool:
+        """
+        根据来源删除文档
+        
+        Args:
+            source: 文档来源，或来源列表（一次删除多个来源）
+            prefix: 为True时删除所有以 source 开头的来源（如 "航海手册-"）
+        
         Returns:
             是否成功
         """
         try:
-            # TODO: 实现按来源删除逻辑
-            logger.info(f"Deleted documents from source: {source}")
-            return True
+            self.keyword_index.delete_by_source(source, prefix=prefix)
+            self.query_cache.invalidate()
+            self._stats_cache = None
+            
+            deleted = 0
+            for store in (self.vector_store, self.section_store):
+                if is_local_store(store):
+                    count = store.delete_by_source(source, prefix=prefix)
+                else:
+                    count = await asyncio.get_running_loop().run_in_executor(
+                        None,
+                        lambda: store.delete_by_source(source, prefix=prefix)
+                    )
+                if store is self.vector_store:
+                    deleted = count
             
+            label = source if isinstance(source, str) else f"{len(source)} sources"
+            logger.info(f"Deleted {deleted} chunks from source: {label}{'*' if prefix else ''}")
+            return True
+        
         except Exception as e:
             logger.error(f"Delete documents error: {e}")
             return False
     
+    def persist(self) -> None:
+        """将本地索引写入磁盘（PGVector向量本身无需此步骤）"""
+        self.snapshot()()
+    
+    def snapshot(self) -> Callable[[], None]:
+        """复制本地索引和关键词索引的当前内容，返回写入磁盘的函数（可在线程中执行）"""
+        writers = [
+            store.snapshot() for store in (self.vector_store, self.section_store)
+            if hasattr(store, "snapshot")
+        ]
+        writers.append(self.keyword_index.snapshot(keyword_index_path(self.generation)))
+        
+        def write() -> None:
+            for writer in writers:
+                writer()
+        
+        return write
+    
+    def close(self) -> None:
+        """释放embedding缓存和向量存储的数据库连接池"""
+        cache = getattr(self.embeddings, "cache", None)
+        if cache is not None:
+            cache.close()
+        
+        self.release_stores()
+    
+    def release_stores(self) -> None:
+        """释放向量存储的数据库连接池（每个代际的存储各有一个连接池）"""
+        _release(self.vector_store, self.section_store)
+    
+    def open_generation(self, generation: str) -> "RAGService":
+        """
+        打开一个新的索引代际，返回写入该代际的RAGService
+        
+        与当前实例共享embedding客户端、切分器和tokenizer，向量存储、
+        关键词索引和检索缓存各自独立，写入新代际不影响当前检索。
+        """
+        staging = copy.copy(self)
+        staging.generation = generation
+        staging.vector_store = create_vector_store(self.embeddings, generation)
+        staging.section_store = create_section_store(self.embeddings, generation)
+        staging.keyword_index = KeywordIndex()
+        staging.query_cache = QueryCache(max_entries=0, ttl=settings.QUERY_CACHE_TTL)
+        staging._stats_cache = None
+        return staging
+    
+    def swap_generation(self, staging: "RAGService") -> "RAGService":
+        """
+        切换到 staging 的索引
+        
+        先持久化新索引、改写代际指针，再替换引用：之后的检索全部走新索引，
+        已在执行的检索仍持有旧对象。其他服务进程通过 follow_active_generation
+        跟随切换。返回持有旧索引的实例，调用方确认没有进程再使用后用
+        discard_generation 回收（见 KnowledgeLoader.rebuild_index）。
+        """
+        staging.persist()
+        set_active_generation(staging.generation)
+        return self._activate(
+            staging.generation,
+            staging.vector_store,
+            staging.section_store,
+            staging.keyword_index
+        )
+    
+    async def follow_active_generation(self) -> Optional["RAGService"]:
+        """
+        跟随代际指针切换（其他进程重建后改写了指针，如 init_data.py --full）
+        
+        打开指针指向的代际并替换引用，返回持有旧索引的实例；指针未变化时
+        返回None。旧代际的数据由重建方在所有服务进程切走后回收，这里
+        只需在进行中的检索结束后调用 release_stores 释放连接池。
+        """
+        generation = await asyncio.to_thread(active_generation)
+        if generation == self.generation:
+            return None
+        
+        stores = await asyncio.to_thread(self._open_stores, generation)
+        if self.generation == generation or active_generation() != generation:
+            # 打开期间本进程已切换，或指针又被改写，下一轮再跟随
+            _release(*stores[:2])
+            return None
+        return self._activate(generation, *stores)
+    
+    def _open_stores(self, generation: Optional[str]) -> Tuple:
+        """打开已有代际的向量存储、章节索引和关键词索引"""
+        vector_store = create_vector_store(self.embeddings, generation)
+        return (
+            vector_store,
+            create_section_store(self.embeddings, generation),
+            self._load_keyword_index(keyword_index_path(generation), vector_store)
+        )
+    
+    def _activate(
+        self,
+        generation: Optional[str],
+        vector_store,
+        section_store,
+        keyword_index: KeywordIndex
+    ) -> "RAGService":
+        """替换索引引用：之后的检索全部走新索引，已在执行的检索仍持有旧对象"""
+        retired = copy.copy(self)
+        self.generation = generation
+        self.vector_store = vector_store
+        self.section_store = section_store
+        self.keyword_index = keyword_index
+        self.query_cache.invalidate()
+        self._stats_cache = None
+        logger.info(f"Switched to index generation {generation}")
+        return retired
+    
+    async def discard_generation(self, staging: "RAGService") -> None:
+        """删除未切换或已被替换的代际，并释放其连接池"""
+        await self._drop_generation(staging.generation, staging.vector_store, staging.section_store)
+    
+    async def _drop_generation(self, generation: Optional[str], *stores) -> None:
+        """删除一个代际的向量数据和本地文件，失败只记录日志"""
+        try:
+            for store in stores:
+                if is_local_store(store):
+                    store.drop()
+                else:
+                    await asyncio.get_running_loop().run_in_executor(None, store.drop)
+            remove_generation_files(generation)
+        except Exception as e:
+            logger.warning(f"Failed to drop index generation {generation}: {e}")
+        finally:
+            _release(*stores)
+    
     async def get_stats(self) -> Dict:
         """
         获取知识库统计信息
         
+        聚合查询结果缓存 STATS_CACHE_TTL 秒，写入/删除时失效，
+        避免状态面板轮询时反复扫描。
+        
         Returns:
             统计信息字典
         """
         try:
-            # TODO: 实现统计信息查询
+            now = time.monotonic()
+            if self._stats_cache is None or self._stats_cache[0] < now:
+                if is_local_store(self.vector_store):
+                    groups = self.vector_store.stats()
+                else:
+                    groups = await asyncio.get_running_loop().run_in_executor(
+                        None, self.vector_store.stats
+                    )
+                self._stats_cache = (now + settings.STATS_CACHE_TTL, groups)
+            groups = self._stats_cache[1]
+            
+            last_updated = max(
+                (g["last_updated"] for g in groups if g["last_updated"]),
+                default=None
+            )
             return {
-                "total_documents": 0,
-                "total_chunks": 0,
-                "sources": []
+                "total_documents": sum(g["documents"] for g in groups),
+                "total_chunks": sum(g["chunks"] for g in groups),
+                "sources": groups,
+                "last_updated": last_updated,
+                "query_cache": self.query_cache.stats(),
+                "query_embeddings": self.query_embedder.stats()
             }
-            
+        
         except Exception as e:
             logger.error(f"Get stats error: {e}")
             return {}
@@ -179,16 +758,23 @@ class RAGService:
             query: 查询文本
             k: 返回结果数量
             alpha: 向量搜索权重
-            
+        
         Returns:
-            搜索结果
+            搜索结果（score为融合后的RRF分数，越大越相关）
         """
+        cache_key = self.query_cache.make_key("hybrid", query, k=k, alpha=alpha)
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = self.query_cache.generation
+        
         try:
-            # 向量搜索
-            vector_results = await self.search(query, k=k)
-            
-            # 关键词搜索（简单实现）
-            keyword_results = await self._keyword_search(query, k=k)
+            # 两路检索并发执行，各自限时，慢的一路不拖累整体
+            fetch_k = k * 2
+            vector_results, keyword_results = await asyncio.gather(
+                self._run_leg("vector", self.search(query, k=fetch_k, mmr=False, neighbors=0)),
+                self._run_leg("keyword", self._keyword_search(query, k=fetch_k))
+            )
             
             # 结果融合
             combined_results = self._combine_results(
@@ -197,23 +783,145 @@ class RAGService:
                 alpha
             )
             
+            # 有一路失败时只返回不缓存
+            if vector_results is not None and keyword_results is not None:
+                self.query_cache.set(cache_key, combined_results[:k], generation)
             return combined_results[:k]
-            
+        
         except Exception as e:
             logger.error(f"Hybrid search error: {e}")
             return await self.search(query, k)
     
+    async def _run_leg(self, name: str, coro) -> Optional[List[Dict]]:
+        """执行一路检索，超时或出错时返回None"""
+        try:
+            return await asyncio.wait_for(coro, timeout=settings.HYBRID_LEG_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Hybrid search {name} leg timed out")
+        except Exception as e:
+            logger.error(f"Hybrid search {name} leg error: {e}")
+        return None
+    
     async def _keyword_search(self, query: str, k: int = 5) -> List[Dict]:
-        """关键词搜索（基于PostgreSQL全文搜索）"""
-        # TODO: 实现关键词搜索
-        return []
+        """关键词搜索（内存BM25倒排索引，无需embedding调用）"""
+        return self.keyword_index.search(query, k=k)
+    
+    @staticmethod
+    def _load_keyword_index(path: str, vector_store=None) -> KeywordIndex:
+        """
+        加载关键词索引
+        
+        pgvector 后端从数据库中的文档块重建：索引文件只在执行导入的进程所在
+        机器上，其他服务进程没有这个文件，或者文件比数据库旧。本地索引和
+        重建失败时读取持久化的文件，不存在时返回空索引。
+        """
+        if hasattr(vector_store, "iter_documents"):
+            try:
+                index = KeywordIndex()
+                index.add_documents(list(vector_store.iter_documents()))
+                logger.info(f"Keyword index rebuilt from vector store: {len(index)} chunks")
+                return index
+            except Exception as e:
+                logger.warning(f"Failed to rebuild keyword index from vector store: {e}")
+        
+        path = Path(path)
+        if path.exists():
+            try:
+                return KeywordIndex.load(str(path))
+            except Exception as e:
+                logger.warning(f"Failed to load keyword index, starting empty: {e}")
+        return KeywordIndex()
     
     def _combine_results(
         self, 
-        vector_results: List[Dict], 
-        keyword_results: List[Dict], 
+        vector_results: Optional[List[Dict]], 
+        keyword_results: Optional[List[Dict]], 
         alpha: float
     ) -> List[Dict]:
-        """结果融合算法"""
-        # TODO: 实现更复杂的结果融合逻辑
-        return vector_results
\ No newline at end of file
+        """
+        结果融合算法（加权倒数排名融合 RRF）
+        
+        score = alpha / (RRF_K + 向量排名) + (1 - alpha) / (RRF_K + 关键词排名)
+        两路分数量纲不同（距离 vs BM25），因此只使用排名；同一文档块按
+        (source, chunk_index) 去重。
+        """
+        fused: Dict[tuple, Dict] = {}
+        
+        for weight, results in ((alpha, vector_results), (1 - alpha, keyword_results)):
+            for rank, doc in enumerate(results or [], start=1):
+                key = self._chunk_key(doc)
+                entry = fused.get(key)
+                if entry is None:
+                    entry = {
+                        "content": doc["content"],
+                        "metadata": doc["metadata"],
+                        "score": 0.0
+                    }
+                    fused[key] = entry
+                entry["score"] += weight / (settings.RRF_K + rank)
+        
+        return sorted(fused.values(), key=lambda d: d["score"], reverse=True)
+    
+    @staticmethod
+    def _chunk_key(doc: Dict) -> tuple:
+        """文档块标识"""
+        metadata = doc["metadata"]
+        if "chunk_index" in metadata:
+            return (metadata.get("source"), metadata["chunk_index"])
+        return (metadata.get("source"), doc["content"])
+
+
+def create_text_splitter() -> RecursiveCharacterTextSplitter:
+    """按配置创建文本切分器"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?"]
+    )
+
+
+_process_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def split_texts(texts: List[str]) -> List[List[str]]:
+    """
+    批量切分文本（可在进程池中执行）
+    
+    切分器在每个工作进程内只创建一次，切分规则与 RAGService.split_document 相同。
+    """
+    global _process_splitter
+    if _process_splitter is None:
+        _process_splitter = create_text_splitter()
+    return [_process_splitter.split_text(text) for text in texts]
+
+
+def _release(*stores) -> None:
+    """释放PGVector存储的连接池（本地索引没有连接池）"""
+    for store in stores:
+        bind = getattr(store, "_bind", None)
+        if bind is not None and hasattr(bind, "dispose"):
+            bind.dispose()
+
+
+def _is_manual(metadata: Dict) -> bool:
+    return (metadata.get("source_type") or source_type_for(metadata.get("source"))) == "manual"
+
+
+def _stitch_chunks(texts: List[str]) -> str:
+    """
+    拼接相邻块，去掉前一块结尾与后一块开头的重叠部分
+    
+    重叠至少要有 CHUNK_OVERLAP 的一半才算数，避免把恰好相同的一两个字符
+    （如句号）当成重叠吃掉；找不到重叠时（块边界落在段落之间、或中间有块
+    缺失）用换行连接。
+    """
+    minimum = max(settings.CHUNK_OVERLAP // 2, 1)
+    stitched = texts[0]
+    for text in texts[1:]:
+        overlap = 0
+        for size in range(min(len(stitched), len(text), settings.CHUNK_OVERLAP * 2), minimum - 1, -1):
+            if stitched.endswith(text[:size]):
+                overlap = size
+                break
+        stitched += text[overlap:] if overlap else "\n" + text
+    return stitched
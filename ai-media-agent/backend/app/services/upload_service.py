@@ -0,0 +1,168 @@
+"""
+知识库文档上传服务
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import UploadFile
+
+from app.core.config import settings
+from app.services.ingest_jobs import IngestJob, IngestJobManager
+from app.services.knowledge_loader import KnowledgeLoader
+from app.services.rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_SUFFIXES = (".txt", ".md")
+# 文件名中只保留字母数字（含中文）、点和连字符
+_UNSAFE_FILENAME_PATTERN = re.compile(r'[^\w.\-]+')
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过 UPLOAD_MAX_BYTES"""
+
+
+class UploadService:
+    """
+    文档上传：流式落盘 → 按内容hash去重 → 后台导入
+    
+    上传内容按 UPLOAD_CHUNK_SIZE 分块写入临时文件并同时计算sha256，
+    不会整体读入内存；相同内容的文件只导入一次。文件保存在
+    KNOWLEDGE_BASE_PATH/uploads/<hash前缀>-<文件名>，重建索引时同样会被导入。
+    同名文件再次上传视为新版本，替换旧版本。
+    
+    导入在后台任务中执行，切分在进程池中进行；多个上传任务按提交顺序
+    依次执行（与帖子监听共用 lock），避免并发写同一份导入清单。
+    """
+    
+    def __init__(
+        self,
+        rag_service: RAGService,
+        jobs: IngestJobManager,
+        lock: Optional[asyncio.Lock] = None
+    ):
+        self.rag_service = rag_service
+        self.jobs = jobs
+        self.upload_dir = Path(settings.KNOWLEDGE_BASE_PATH) / "uploads"
+        self.spool_dir = self.upload_dir / ".spool"
+        self._lock = lock or asyncio.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    async def submit(self, file: UploadFile) -> Dict:
+        """
+        保存上传文件并提交导入任务，立即返回
+        
+        Raises:
+            ValueError: 文件类型不支持
+            UploadTooLargeError: 文件过大
+        """
+        filename = self._safe_filename(file.filename or "")
+        if Path(filename).suffix.lower() not in ALLOWED_SUFFIXES:
+            raise ValueError(f"Unsupported file type, expected one of {', '.join(ALLOWED_SUFFIXES)}")
+        
+        spool_path, digest, size = await self._spool(file)
+        
+        duplicate = self._find_by_digest(digest)
+        if duplicate is not None:
+            spool_path.unlink(missing_ok=True)
+            logger.info(f"Duplicate upload skipped: {filename} ({digest[:16]})")
+            return {
+                "duplicate": True,
+                "filename": filename,
+                "existing_file": duplicate.name,
+                "sha256": digest,
+                "size": size
+            }
+        
+        path = self.upload_dir / f"{digest[:16]}-{filename}"
+        os.replace(spool_path, path)
+        
+        async def run(job: IngestJob) -> bool:
+            ok = False
+            try:
+                async with self._lock:
+                    loader = KnowledgeLoader(
+                        self.rag_service,
+                        progress=job.progress,
+                        split_executor=self._split_executor()
+                    )
+                    ok = await loader.load_uploads([path])
+                    if ok:
+                        # 新版本已覆盖同名来源的索引，旧文件不再需要
+                        self._remove_older_versions(path)
+                    return ok
+            finally:
+                # 导入失败或取消时删除文件，重新上传不会被当成重复
+                if not ok:
+                    path.unlink(missing_ok=True)
+        
+        job = self.jobs.submit("upload", run, exclusive=False)
+        return {
+            "duplicate": False,
+            "filename": filename,
+            "sha256": digest,
+            "size": size,
+            **job.to_dict()
+        }
+    
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    async def _spool(self, file: UploadFile) -> Tuple[Path, str, int]:
+        """分块写入临时文件，返回 (临时文件路径, sha256, 字节数)"""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        spool_path = self.spool_dir / f"{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = 0
+        
+        try:
+            with open(spool_path, "wb") as out:
+                while True:
+                    chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > settings.UPLOAD_MAX_BYTES:
+                        raise UploadTooLargeError(
+                            f"File exceeds {settings.UPLOAD_MAX_BYTES} bytes"
+                        )
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            spool_path.unlink(missing_ok=True)
+            raise
+        
+        return spool_path, digest.hexdigest(), size
+    
+    def _find_by_digest(self, digest: str) -> Optional[Path]:
+        if not self.upload_dir.exists():
+            return None
+        return next(self.upload_dir.glob(f"{digest[:16]}-*"), None)
+    
+    def _remove_older_versions(self, path: Path) -> None:
+        _, _, filename = path.name.partition("-")
+        for other in self.upload_dir.glob(f"*-{filename}"):
+            if other != path and other.is_file() and other.name.partition("-")[2] == filename:
+                other.unlink(missing_ok=True)
+    
+    def _split_executor(self) -> Optional[ProcessPoolExecutor]:
+        """进程池在第一次上传时创建"""
+        if settings.UPLOAD_SPLIT_WORKERS <= 0:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.UPLOAD_SPLIT_WORKERS)
+        return self._executor
+    
+    @staticmethod
+    def _safe_filename(filename: str) -> str:
+        name = _UNSAFE_FILENAME_PATTERN.sub("_", Path(filename).name).strip("._")
+        return name or "upload.txt"
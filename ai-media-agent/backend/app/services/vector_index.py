@@ -0,0 +1,242 @@
+"""
+pgvector ANN索引管理
+"""
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.db.base import engine as default_engine
+from app.services.vector_store import PROMOTED_METADATA_COLUMNS, SOURCE_TYPE_PREFIXES
+
+logger = logging.getLogger(__name__)
+
+# 可建索引的向量列：LangChain集合表的列没有固定维度，需要按表达式建索引
+INDEXABLE_TABLES = {
+    "langchain_pg_embedding": "(embedding::vector({dim}))",
+    "knowledge_chunks": "embedding",
+}
+
+# 距离策略对应的索引operator class
+OPERATOR_CLASSES = {
+    "cosine": "vector_cosine_ops",
+    "inner_product": "vector_ip_ops",
+    "l2": "vector_l2_ops",
+}
+
+INDEX_METHODS = ("hnsw", "ivfflat")
+
+# halfvec（float16）索引的表达式，配合 VECTOR_QUANTIZATION=float16 使用
+HALFVEC_EXPRESSION = "(embedding::halfvec({dim}))"
+
+# 按 source_type 建部分索引时的分区
+INDEX_PARTITIONS = tuple(SOURCE_TYPE_PREFIXES.values())
+
+
+class VectorIndexManager:
+    """
+    向量列的HNSW / IVFFlat索引管理
+    
+    查询时的召回/速度权衡由 hnsw.ef_search / ivfflat.probes 控制，
+    见 RAGService.search 的 ef_search / probes 参数。
+    """
+    
+    def __init__(self, engine: Optional[AsyncEngine] = None):
+        self.engine = engine or default_engine
+    
+    @staticmethod
+    def index_name(
+        table: str,
+        method: str,
+        partition: Optional[str] = None,
+        halfvec: bool = False
+    ) -> str:
+        name = f"idx_{table}_embedding_{method}"
+        if halfvec:
+            name += "_halfvec"
+        return f"{name}_{partition}" if partition else name
+    
+    async def create_index(
+        self,
+        method: str = "hnsw",
+        table: str = "langchain_pg_embedding",
+        distance: Optional[str] = None,
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: Optional[int] = None,
+        concurrently: bool = True,
+        partition: Optional[str] = None,
+        halfvec: bool = False
+    ) -> Dict:
+        """
+        创建ANN索引
+        
+        Args:
+            method: hnsw 或 ivfflat
+            table: 向量所在的表
+            distance: cosine / inner_product / l2，默认取 VECTOR_DISTANCE
+            m: HNSW每个节点的连接数
+            ef_construction: HNSW构建时的候选列表大小
+            lists: IVFFlat聚类数，默认按 行数/1000 估算
+            concurrently: 是否使用 CREATE INDEX CONCURRENTLY（不阻塞写入）
+            partition: 只为该 source_type 建部分索引（WHERE source_type = ...）
+            halfvec: 在float16压缩向量上建索引（体积减半，查询时再用原向量重排）
+        
+        Returns:
+            索引名、构建耗时和大小
+        """
+        self._validate(method, table, partition)
+        distance = distance or settings.VECTOR_DISTANCE
+        if distance not in OPERATOR_CLASSES:
+            raise ValueError(f"Unsupported distance: {distance}")
+        
+        name = self.index_name(table, method, partition, halfvec)
+        column = (HALFVEC_EXPRESSION if halfvec else INDEXABLE_TABLES[table]).format(
+            dim=settings.EMBEDDING_DIMENSION
+        )
+        operator_class = OPERATOR_CLASSES[distance]
+        if halfvec:
+            operator_class = operator_class.replace("vector_", "halfvec_", 1)
+        where = f" WHERE source_type = '{partition}'" if partition else ""
+        
+        if method == "hnsw":
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        else:
+            if lists is None:
+                lists = max(await self._count_rows(table, partition) // 1000, 10)
+            options = f"lists = {int(lists)}"
+        
+        statement = (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+            f"ON {table} USING {method} ({column} {operator_class}) "
+            f"WITH ({options}){where}"
+        )
+        
+        # CONCURRENTLY 不能在事务中执行
+        started = time.perf_counter()
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(statement))
+        build_seconds = time.perf_counter() - started
+        
+        info = await self.get_index(name)
+        info["build_seconds"] = round(build_seconds, 3)
+        logger.info(f"Created vector index {name} in {build_seconds:.1f}s")
+        return info
+    
+    async def drop_index(
+        self,
+        method: str = "hnsw",
+        table: str = "langchain_pg_embedding",
+        concurrently: bool = True,
+        partition: Optional[str] = None,
+        halfvec: bool = False
+    ) -> bool:
+        """删除ANN索引"""
+        self._validate(method, table, partition)
+        name = self.index_name(table, method, partition, halfvec)
+        
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(
+                f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"
+            ))
+        
+        logger.info(f"Dropped vector index {name}")
+        return True
+    
+    async def create_metadata_indexes(self, concurrently: bool = True) -> List[str]:
+        """
+        建立元数据过滤用的生成列和B树索引（一次性迁移，见 IndexedPGVector）
+        
+        ADD COLUMN ... STORED 会重写 langchain_pg_embedding 并持有排他锁，
+        只在列不存在时执行，应在维护窗口运行；索引用 CREATE INDEX CONCURRENTLY
+        建立，不阻塞检索和写入。
+        
+        Returns:
+            执行的语句
+        """
+        columns = ", ".join(f"'{column}'" for column in PROMOTED_METADATA_COLUMNS)
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(
+                "SELECT column_name FROM information_schema.columns "
+                f"WHERE table_name = 'langchain_pg_embedding' AND column_name IN ({columns})"
+            ))
+            existing = {row.column_name for row in result}
+        
+        concurrently_clause = "CONCURRENTLY " if concurrently else ""
+        statements = [
+            f"ALTER TABLE langchain_pg_embedding ADD COLUMN IF NOT EXISTS {column} text "
+            f"GENERATED ALWAYS AS (cmetadata->>'{column}') STORED"
+            for column in PROMOTED_METADATA_COLUMNS
+            if column not in existing
+        ]
+        # source 使用表达式索引（text_pattern_ops 同时支持等值和前缀匹配）
+        statements.append(
+            f"CREATE INDEX {concurrently_clause}IF NOT EXISTS idx_langchain_pg_embedding_source "
+            f"ON langchain_pg_embedding (collection_id, (cmetadata->>'source') text_pattern_ops)"
+        )
+        # 相邻块扩展按 (source, chunk_index) 批量取块
+        statements.append(
+            f"CREATE INDEX {concurrently_clause}IF NOT EXISTS idx_langchain_pg_embedding_source_chunk "
+            f"ON langchain_pg_embedding "
+            f"(collection_id, (cmetadata->>'source'), (cmetadata->>'chunk_index'))"
+        )
+        statements.extend(
+            f"CREATE INDEX {concurrently_clause}IF NOT EXISTS idx_langchain_pg_embedding_{column} "
+            f"ON langchain_pg_embedding (collection_id, {column})"
+            for column in PROMOTED_METADATA_COLUMNS
+        )
+        
+        # CONCURRENTLY 不能在事务中执行
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for statement in statements:
+                started = time.perf_counter()
+                await conn.execute(text(statement))
+                logger.info(f"{statement} ({time.perf_counter() - started:.1f}s)")
+        return statements
+    
+    async def list_indexes(self) -> List[Dict]:
+        """列出所有向量表上的HNSW / IVFFlat索引及其大小"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text("""
+                    SELECT i.relname AS name,
+                           t.relname AS table_name,
+                           am.amname AS method,
+                           pg_relation_size(i.oid) AS size_bytes,
+                           pg_get_indexdef(i.oid) AS definition
+                    FROM pg_index x
+                    JOIN pg_class i ON i.oid = x.indexrelid
+                    JOIN pg_class t ON t.oid = x.indrelid
+                    JOIN pg_am am ON am.oid = i.relam
+                    WHERE am.amname IN ('hnsw', 'ivfflat')
+                    ORDER BY t.relname, i.relname
+                """)
+            )
+            return [dict(row._mapping) for row in result]
+    
+    async def get_index(self, name: str) -> Dict:
+        for info in await self.list_indexes():
+            if info["name"] == name:
+                return info
+        return {"name": name}
+    
+    async def _count_rows(self, table: str, partition: Optional[str] = None) -> int:
+        where = f" WHERE source_type = '{partition}'" if partition else ""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(f"SELECT COUNT(*) FROM {table}{where}"))
+            return result.scalar() or 0
+    
+    @staticmethod
+    def _validate(method: str, table: str, partition: Optional[str] = None) -> None:
+        if method not in INDEX_METHODS:
+            raise ValueError(f"Unsupported index method: {method}")
+        if table not in INDEXABLE_TABLES:
+            raise ValueError(f"Unsupported table: {table}")
+        if partition is not None and partition not in INDEX_PARTITIONS:
+            raise ValueError(f"Unsupported partition: {partition}")
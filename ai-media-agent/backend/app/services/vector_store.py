@@ -0,0 +1,1243 @@
+"""
+向量存储后端
+"""
+import heapq
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain.schema import Document
+from langchain.vectorstores.pgvector import DistanceStrategy, PGVector
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.services.index_generations import collection_name, generation_path
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_TYPES = ("none", "float16", "int8")
+_CODE_DTYPES = {"float16": np.float16, "int8": np.int8}
+# 粗排时每次转换为float32的行数
+_SCAN_BLOCK_ROWS = 1024
+# 拟合PCA投影时最多采样的行数
+_PCA_SAMPLE_ROWS = 20000
+
+
+class NumpyVectorStore:
+    """
+    进程内NumPy向量索引
+    
+    所有向量保存在一块连续的float32矩阵中，检索时一次矩阵乘法 + argpartition
+    取top-k；元数据过滤使用缓存的布尔掩码。接口与PGVector保持一致，
+    返回的score同样是距离（越小越相似）。
+    
+    开启 quantization（float16 / int8，可选PCA降到 quantization_dims 维）后，
+    首轮扫描只读压缩后的向量，取 k * rerank_factor 个候选再用float32原向量
+    精确重排。从磁盘加载时原向量以mmap方式打开，只有被重排的行会读入内存。
+    """
+    
+    def __init__(
+        self,
+        embedding_function,
+        persist_path: Optional[str] = None,
+        distance_strategy: str = "cosine",
+        quantization: str = "none",
+        quantization_dims: Optional[int] = None,
+        rerank_factor: int = 4
+    ):
+        if distance_strategy not in ("cosine", "inner_product"):
+            raise ValueError(f"Unsupported distance strategy: {distance_strategy}")
+        if quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        
+        self.embedding_function = embedding_function
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.distance_strategy = distance_strategy
+        self.quantization = quantization
+        self.quantization_dims = quantization_dims
+        self.rerank_factor = max(int(rerank_factor), 1)
+        
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._projection: Optional[np.ndarray] = None
+        self._encoded = 0
+        self._size = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._mask_cache: Dict[Tuple[str, str], np.ndarray] = {}
+        self._chunk_rows: Optional[Dict[Tuple[str, int], int]] = None
+        
+        if self.persist_path and (self.persist_path / "embeddings.npy").exists():
+            self.load()
+    
+    def __len__(self) -> int:
+        return int(self._alive[:self._size].sum())
+    
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[Dict]] = None
+    ) -> List[int]:
+        """写入已计算好的向量，返回行号"""
+        if not texts:
+            return []
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Embeddings must be a 2-D array aligned with texts")
+        if self.distance_strategy == "cosine":
+            vectors = self._normalize(vectors)
+        
+        metadatas = metadatas or [{} for _ in texts]
+        start = self._size
+        self._reserve(start + len(texts), vectors.shape[1])
+        
+        self._matrix[start:start + len(texts)] = vectors
+        self._alive[start:start + len(texts)] = True
+        self._texts.extend(texts)
+        self._metadatas.extend(dict(m) for m in metadatas)
+        self._size += len(texts)
+        
+        # 增量更新已缓存的过滤掩码和块位置索引
+        for (key, value), mask in self._mask_cache.items():
+            mask[start:self._size] = [
+                _metadata_value(m, key) == value for m in metadatas
+            ]
+        if self._chunk_rows is not None:
+            for row in range(start, self._size):
+                key = _chunk_key(self._metadatas[row])
+                if key is not None:
+                    self._chunk_rows[key] = row
+        
+        return list(range(start, self._size))
+    
+    async def aadd_documents(self, documents: List[Document]) -> List[int]:
+        """计算向量并写入文档"""
+        texts = [doc.page_content for doc in documents]
+        embeddings = await self.embedding_function.aembed_documents(texts)
+        return self.add_embeddings(
+            texts,
+            embeddings,
+            [doc.metadata for doc in documents]
+        )
+    
+    def delete(self, filter: Dict[str, Any]) -> int:
+        """按元数据删除，返回删除的行数"""
+        mask = self._filter_mask(filter) & self._alive[:self._size]
+        deleted = int(mask.sum())
+        if deleted:
+            self._alive[:self._size][mask] = False
+            self._maybe_compact()
+        return deleted
+    
+    def delete_by_source(self, source: Union[str, List[str]], prefix: bool = False) -> int:
+        """
+        按来源删除，source 可以是来源列表（一次扫描删除多个来源）；
+        prefix=True 时删除所有以 source 开头的来源
+        """
+        if prefix:
+            matches = lambda name: name.startswith(source)
+        else:
+            sources = {source} if isinstance(source, str) else set(source)
+            matches = lambda name: name in sources
+        
+        alive = self._alive[:self._size]
+        mask = np.fromiter(
+            (matches(str(m.get("source", ""))) for m in self._metadatas),
+            dtype=bool,
+            count=self._size
+        ) & alive
+        deleted = int(mask.sum())
+        if deleted:
+            alive[mask] = False
+            self._maybe_compact()
+        return deleted
+    
+    def stats(self) -> List[Dict]:
+        """按 source_type 汇总文档数、块数和最后写入时间"""
+        groups: Dict[Optional[str], Dict] = {}
+        for row in np.flatnonzero(self._alive[:self._size]):
+            metadata = self._metadatas[row]
+            group = groups.setdefault(
+                metadata.get("source_type"),
+                {"sources": set(), "chunks": 0, "last_updated": None}
+            )
+            group["sources"].add(metadata.get("source"))
+            group["chunks"] += 1
+            ingested_at = metadata.get("ingested_at")
+            if ingested_at and (group["last_updated"] is None or ingested_at > group["last_updated"]):
+                group["last_updated"] = ingested_at
+        
+        return [
+            {
+                "source_type": source_type,
+                "documents": len(group["sources"]),
+                "chunks": group["chunks"],
+                "last_updated": group["last_updated"]
+            }
+            for source_type, group in groups.items()
+        ]
+    
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        return_embeddings: bool = False
+    ) -> List[Tuple]:
+        """按向量检索top-k；return_embeddings=True 时每项附带该行向量"""
+        if self._size == 0 or k <= 0:
+            return []
+        
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.distance_strategy == "cosine":
+            query = self._normalize(query[None, :])[0]
+        
+        mask = self._alive[:self._size]
+        if filter:
+            mask = mask & self._filter_mask(filter)
+        
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        
+        if self.quantization != "none" and candidates.size > k * self.rerank_factor:
+            # 首轮用压缩向量粗排，只对候选行计算精确分数
+            coarse = self._coarse_scores(query, candidates)
+            shortlist = np.argpartition(-coarse, k * self.rerank_factor - 1)[:k * self.rerank_factor]
+            candidates = candidates[np.sort(shortlist)]
+            scores = self._matrix[candidates] @ query
+        elif candidates.size == self._size:
+            scores = self._matrix[:self._size] @ query
+        else:
+            scores = self._matrix[candidates] @ query
+        
+        if k < scores.size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.size)
+        top = top[np.argsort(-scores[top])]
+        
+        results = []
+        for pos in top:
+            row = int(candidates[pos])
+            result = (
+                Document(
+                    page_content=self._texts[row],
+                    metadata=self._metadatas[row]
+                ),
+                self._to_distance(float(scores[pos]))
+            )
+            if return_embeddings:
+                result += (np.asarray(self._matrix[row], dtype=np.float32),)
+            results.append(result)
+        return results
+    
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按 (source, chunk_index) 批量取文档块，不存在的键跳过"""
+        if self._chunk_rows is None:
+            self._chunk_rows = {}
+            for row, metadata in enumerate(self._metadatas):
+                key = _chunk_key(metadata)
+                if key is not None:
+                    self._chunk_rows[key] = row
+        
+        documents = []
+        for key in keys:
+            row = self._chunk_rows.get(key)
+            if row is not None and self._alive[row]:
+                documents.append(Document(
+                    page_content=self._texts[row],
+                    metadata=self._metadatas[row]
+                ))
+        return documents
+    
+    async def asimilarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """按文本检索top-k"""
+        embedding = await self.embedding_function.aembed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, filter)
+    
+    def save(self) -> None:
+        """保存到磁盘（先写临时文件再替换，避免写到一半的索引）"""
+        self.snapshot()()
+    
+    def snapshot(self) -> Callable[[], None]:
+        """
+        复制当前内容，返回把这份副本写入磁盘的函数
+        
+        复制很快，写文件较慢：返回的函数可以放到线程中执行，期间索引照常
+        读写。
+        """
+        if not self.persist_path:
+            return lambda: None
+        
+        self._compact()
+        persist_path = self.persist_path
+        matrix = self._matrix[:self._size].copy()
+        data = {
+            "distance_strategy": self.distance_strategy,
+            "texts": list(self._texts),
+            "metadatas": list(self._metadatas)
+        }
+        
+        def write() -> None:
+            persist_path.mkdir(parents=True, exist_ok=True)
+            matrix_path = persist_path / "embeddings.npy"
+            docs_path = persist_path / "documents.json"
+            tmp_matrix = persist_path / "embeddings.tmp.npy"
+            tmp_docs = persist_path / "documents.tmp.json"
+            
+            np.save(tmp_matrix, matrix)
+            with open(tmp_docs, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            
+            os.replace(tmp_matrix, matrix_path)
+            os.replace(tmp_docs, docs_path)
+            logger.info(f"Vector index saved: {len(matrix)} vectors -> {persist_path}")
+        
+        return write
+    
+    def load(self) -> None:
+        """从磁盘加载"""
+        # 量化模式下原向量只在重排时按行读取，用mmap打开不占常驻内存
+        matrix = np.load(
+            self.persist_path / "embeddings.npy",
+            mmap_mode="r" if self.quantization != "none" else None
+        )
+        with open(self.persist_path / "documents.json", 'r', encoding='utf-8') as f:
+            docs = json.load(f)
+        
+        self._matrix = matrix if isinstance(matrix, np.memmap) else np.ascontiguousarray(matrix, dtype=np.float32)
+        self._size = len(self._matrix)
+        self._alive = np.ones(self._size, dtype=bool)
+        self._texts = docs["texts"]
+        self._metadatas = docs["metadatas"]
+        self._mask_cache.clear()
+        self._chunk_rows = None
+        self._reset_codes()
+        logger.info(f"Vector index loaded: {self._size} vectors from {self.persist_path}")
+    
+    def drop(self) -> None:
+        """删除磁盘上的索引文件（蓝绿切换后回收旧索引）"""
+        if not self.persist_path:
+            return
+        for name in ("embeddings.npy", "documents.json"):
+            (self.persist_path / name).unlink(missing_ok=True)
+    
+    def memory_usage(self) -> Dict[str, int]:
+        """常驻内存中各部分向量数据的字节数（mmap的原向量不计入）"""
+        usage = {"codes": 0, "full_precision": 0}
+        if self._codes is not None:
+            usage["codes"] = self._codes[:self._encoded].nbytes
+            if self._scales is not None:
+                usage["codes"] += self._scales[:self._encoded].nbytes
+        if not isinstance(self._matrix, np.memmap):
+            usage["full_precision"] = self._matrix[:self._size].nbytes
+        return usage
+    
+    def _coarse_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """用压缩向量计算近似分数，分块转换为float32避免整体复制"""
+        self._encode_pending()
+        if self._projection is not None:
+            query = query @ self._projection
+        
+        # 无过滤时按连续切片扫描，省去花式索引的复制
+        contiguous = rows.size == self._size
+        scores = np.empty(rows.size, dtype=np.float32)
+        for start in range(0, rows.size, _SCAN_BLOCK_ROWS):
+            end = min(start + _SCAN_BLOCK_ROWS, rows.size)
+            block = self._codes[start:end] if contiguous else self._codes[rows[start:end]]
+            scores[start:end] = block.astype(np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales[rows]
+        return scores
+    
+    def _encode_pending(self) -> None:
+        """为尚未压缩的行生成压缩向量"""
+        if self._encoded == self._size:
+            return
+        
+        if self._codes is None and self.quantization_dims:
+            # 投影在首次编码时拟合，之后新增的行沿用；重新加载或压缩后重新拟合
+            self._projection = self._fit_projection()
+        
+        vectors = np.asarray(self._matrix[self._encoded:self._size], dtype=np.float32)
+        if self._projection is not None:
+            vectors = vectors @ self._projection
+        
+        capacity = len(self._matrix)
+        if self._codes is None or len(self._codes) < capacity:
+            codes = np.zeros((capacity, vectors.shape[1]), dtype=_CODE_DTYPES[self.quantization])
+            scales = np.ones(capacity, dtype=np.float32) if self.quantization == "int8" else None
+            if self._encoded:
+                codes[:self._encoded] = self._codes[:self._encoded]
+                if scales is not None:
+                    scales[:self._encoded] = self._scales[:self._encoded]
+            self._codes, self._scales = codes, scales
+        
+        end = self._encoded + len(vectors)
+        if self.quantization == "int8":
+            # 每行对称缩放到[-127, 127]
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._codes[self._encoded:end] = np.rint(vectors / scales[:, None]).astype(np.int8)
+            self._scales[self._encoded:end] = scales
+        else:
+            self._codes[self._encoded:end] = vectors
+        self._encoded = end
+    
+    def _fit_projection(self) -> Optional[np.ndarray]:
+        """在已有向量上拟合PCA投影（按行采样）"""
+        dims = self.quantization_dims
+        if not self._size or dims >= self._matrix.shape[1]:
+            return None
+        
+        step = max(self._size // _PCA_SAMPLE_ROWS, 1)
+        sample = np.asarray(self._matrix[:self._size:step], dtype=np.float32)
+        if len(sample) < dims:
+            return None
+        # 不去中心化：保留内积结构，q·x ≈ (qP)·(xP)
+        _, _, vt = np.linalg.svd(sample, full_matrices=False)
+        return np.ascontiguousarray(vt[:dims].T)
+    
+    def _reset_codes(self) -> None:
+        """丢弃压缩向量，下次检索时按当前矩阵重新生成"""
+        self._codes = None
+        self._scales = None
+        self._projection = None
+        self._encoded = 0
+    
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        """
+        组合各字段的布尔掩码
+        
+        列表值或 {"$in": [...]} 表示取其中任一值，{"$nin": [...]} 表示排除这些值
+        （字段缺失的行保留）。
+        """
+        mask = np.ones(self._size, dtype=bool)
+        for key, value in filter.items():
+            values = _filter_values(value)
+            excluded = _excluded_values(value)
+            if values is not None or excluded is not None:
+                any_mask = np.zeros(self._size, dtype=bool)
+                for item in values if values is not None else excluded:
+                    any_mask |= self._value_mask(key, item)
+                mask &= any_mask if values is not None else ~any_mask
+            else:
+                mask &= self._value_mask(key, str(value))
+        return mask
+    
+    def _value_mask(self, key: str, value: str) -> np.ndarray:
+        """获取(key, value)的布尔掩码，首次使用时计算并缓存"""
+        cache_key = (key, value)
+        mask = self._mask_cache.get(cache_key)
+        if mask is None:
+            mask = np.zeros(len(self._alive), dtype=bool)
+            mask[:self._size] = [
+                _metadata_value(m, key) == value for m in self._metadatas
+            ]
+            self._mask_cache[cache_key] = mask
+        return mask[:self._size]
+    
+    def _reserve(self, rows: int, dim: int) -> None:
+        """按倍增策略预留容量，保持矩阵连续"""
+        if self._matrix.shape[1] not in (0, dim) and self._size:
+            raise ValueError(
+                f"Embedding dimension mismatch: {dim} != {self._matrix.shape[1]}"
+            )
+        
+        capacity = len(self._matrix) if self._matrix.shape[1] == dim else 0
+        if rows <= capacity:
+            return
+        
+        new_capacity = max(rows, capacity * 2, 64)
+        matrix = np.zeros((new_capacity, dim), dtype=np.float32)
+        if self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._matrix = matrix
+        self._alive = alive
+        
+        for cache_key, mask in list(self._mask_cache.items()):
+            grown = np.zeros(new_capacity, dtype=bool)
+            grown[:self._size] = mask[:self._size]
+            self._mask_cache[cache_key] = grown
+    
+    def _maybe_compact(self) -> None:
+        """删除行超过1/4时压缩"""
+        dead = self._size - len(self)
+        if dead and dead * 4 >= self._size:
+            self._compact()
+    
+    def _compact(self) -> None:
+        """移除已删除的行"""
+        alive = self._alive[:self._size]
+        if alive.all():
+            return
+        
+        keep = np.flatnonzero(alive)
+        self._matrix = np.ascontiguousarray(self._matrix[keep])
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._size = len(keep)
+        self._alive = np.ones(self._size, dtype=bool)
+        self._mask_cache.clear()
+        self._chunk_rows = None
+        self._reset_codes()
+    
+    def _to_distance(self, score: float) -> float:
+        """相似度转换为与PGVector一致的距离"""
+        if self.distance_strategy == "cosine":
+            return 1.0 - score
+        return -score
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class PartitionedVectorStore:
+    """
+    按 source_type 分区的本地向量索引
+    
+    每个 source_type（manual / qa / case / post）各自一个 NumpyVectorStore。
+    带来源类型的查询只扫描对应分区；无过滤的查询在各分区分别取top-k后合并。
+    """
+    
+    def __init__(
+        self,
+        embedding_function,
+        persist_path: Optional[str] = None,
+        distance_strategy: str = "cosine",
+        **store_kwargs
+    ):
+        self.embedding_function = embedding_function
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.distance_strategy = distance_strategy
+        self.store_kwargs = store_kwargs
+        self.partitions: Dict[str, NumpyVectorStore] = {}
+        
+        if self.persist_path and self.persist_path.exists():
+            for child in sorted(self.persist_path.iterdir()):
+                # 只认分区目录（同一路径下还有章节索引等其他子目录）
+                if child.name in _partition_names() and (child / "embeddings.npy").exists():
+                    self._partition(child.name)
+    
+    def __len__(self) -> int:
+        return sum(len(p) for p in self.partitions.values())
+    
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[Dict]] = None
+    ) -> None:
+        """按 source_type 分组写入各分区"""
+        metadatas = metadatas or [{} for _ in texts]
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(_partition_key(metadata), []).append(i)
+        
+        for name, rows in groups.items():
+            self._partition(name).add_embeddings(
+                [texts[i] for i in rows],
+                [embeddings[i] for i in rows],
+                [metadatas[i] for i in rows]
+            )
+    
+    async def aadd_documents(self, documents: List[Document]) -> None:
+        texts = [doc.page_content for doc in documents]
+        embeddings = await self.embedding_function.aembed_documents(texts)
+        self.add_embeddings(texts, embeddings, [doc.metadata for doc in documents])
+    
+    def delete_by_source(self, source: Union[str, List[str]], prefix: bool = False) -> int:
+        return sum(
+            partition.delete_by_source(source, prefix=prefix)
+            for partition in self._route({"source": source})
+        )
+    
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        return_embeddings: bool = False
+    ) -> List[Tuple]:
+        """路由到相关分区检索，多个分区时合并各自的top-k"""
+        results = []
+        for partition in self._route(filter):
+            results.extend(
+                partition.similarity_search_with_score_by_vector(
+                    embedding, k, filter, return_embeddings=return_embeddings
+                )
+            )
+        return heapq.nsmallest(k, results, key=lambda item: item[1])
+    
+    async def asimilarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        embedding = await self.embedding_function.aembed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, filter)
+    
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按来源推断分区后批量取块"""
+        groups: Dict[str, List[Tuple[str, int]]] = {}
+        for key in keys:
+            groups.setdefault(source_type_for(key[0]) or "", []).append(key)
+        
+        documents = []
+        for source_type, group in groups.items():
+            if source_type in self.partitions:
+                partitions = [self.partitions[source_type]]
+            else:
+                partitions = list(self.partitions.values())
+            for partition in partitions:
+                documents.extend(partition.get_chunks(group))
+        return documents
+    
+    def stats(self) -> List[Dict]:
+        return [row for p in self.partitions.values() for row in p.stats()]
+    
+    def save(self) -> None:
+        self.snapshot()()
+    
+    def snapshot(self) -> Callable[[], None]:
+        writers = [partition.snapshot() for partition in self.partitions.values()]
+        
+        def write() -> None:
+            for writer in writers:
+                writer()
+        
+        return write
+    
+    def drop(self) -> None:
+        for partition in self.partitions.values():
+            partition.drop()
+    
+    def memory_usage(self) -> Dict[str, int]:
+        usage = {"codes": 0, "full_precision": 0}
+        for partition in self.partitions.values():
+            for key, value in partition.memory_usage().items():
+                usage[key] += value
+        return usage
+    
+    def _route(self, filter: Optional[Dict[str, Any]]) -> List[NumpyVectorStore]:
+        """根据过滤条件确定需要扫描的分区；多个来源类型时取各分区的并集"""
+        filter = filter or {}
+        source_type = filter.get("source_type") or source_type_for(filter.get("source"))
+        if source_type is None:
+            return list(self.partitions.values())
+        
+        excluded = _excluded_values(source_type)
+        if excluded is not None:
+            return [p for name, p in self.partitions.items() if name not in excluded]
+        
+        names = _filter_values(source_type)
+        if names is None:
+            names = [str(source_type)]
+        return [self.partitions[name] for name in dict.fromkeys(names) if name in self.partitions]
+    
+    def _partition(self, name: str) -> NumpyVectorStore:
+        partition = self.partitions.get(name)
+        if partition is None:
+            partition = NumpyVectorStore(
+                embedding_function=self.embedding_function,
+                persist_path=str(self.persist_path / name) if self.persist_path else None,
+                distance_strategy=self.distance_strategy,
+                **self.store_kwargs
+            )
+            self.partitions[name] = partition
+        return partition
+
+
+# KnowledgeLoader 生成的来源前缀与 source_type 的对应关系
+SOURCE_TYPE_PREFIXES = {
+    "航海手册-": "manual",
+    "百问百答-": "qa",
+    "爆款案例-": "case",
+    "社群帖子-": "post",
+    "上传文档-": "upload",
+}
+
+
+def source_type_for(source: Optional[str]) -> Optional[str]:
+    """根据来源名（或来源列表）推断 source_type，无法推断时返回None"""
+    if isinstance(source, (list, tuple, set)):
+        source_types = {source_type_for(s) for s in source}
+        return source_types.pop() if len(source_types) == 1 else None
+    if not source:
+        return None
+    for prefix, source_type in SOURCE_TYPE_PREFIXES.items():
+        if source.startswith(prefix):
+            return source_type
+    return None
+
+
+def _partition_names() -> Tuple[str, ...]:
+    return (*SOURCE_TYPE_PREFIXES.values(), "default")
+
+
+def _partition_key(metadata: Dict) -> str:
+    return str(
+        metadata.get("source_type")
+        or source_type_for(metadata.get("source"))
+        or "default"
+    )
+
+
+def is_local_store(store) -> bool:
+    """是否为进程内索引（可直接在事件循环中同步调用）"""
+    return isinstance(store, (NumpyVectorStore, PartitionedVectorStore))
+
+
+def _chunk_key(metadata: Dict) -> Optional[Tuple[str, int]]:
+    source = metadata.get("source")
+    chunk_index = metadata.get("chunk_index")
+    if source is None or chunk_index is None:
+        return None
+    return str(source), int(chunk_index)
+
+
+def _parse_vector(value) -> np.ndarray:
+    """原生SQL查询返回的向量可能是 '[1,2,...]' 文本"""
+    if isinstance(value, str):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _filter_values(value: Any) -> Optional[List[str]]:
+    """多值过滤条件（列表或 {"$in": [...]}）的取值列表，单值条件返回None"""
+    if isinstance(value, dict) and set(value) == {"$in"}:
+        value = value["$in"]
+    if isinstance(value, (list, tuple, set)):
+        return [str(item) for item in value]
+    return None
+
+
+def _excluded_values(value: Any) -> Optional[List[str]]:
+    """排除条件 {"$nin": [...]} 的取值列表，其他条件返回None"""
+    if isinstance(value, dict) and set(value) == {"$nin"}:
+        return [str(item) for item in value["$nin"]]
+    return None
+
+
+def _metadata_value(metadata: Dict, key: str) -> Optional[str]:
+    """与PGVector的 cmetadata[key].astext 语义保持一致"""
+    value = metadata.get(key)
+    return None if value is None else str(value)
+
+
+# pgvector距离运算符，与LangChain的DistanceStrategy一一对应
+_DISTANCE_OPERATORS = {
+    DistanceStrategy.COSINE: "<=>",
+    DistanceStrategy.EUCLIDEAN: "<->",
+    DistanceStrategy.MAX_INNER_PRODUCT: "<#>",
+}
+
+
+# 从 cmetadata 提升为带索引生成列的过滤字段
+PROMOTED_METADATA_COLUMNS = ("source_type", "platform", "priority")
+
+# pgvector 未设置时的 hnsw.ef_search 默认值
+_DEFAULT_EF_SEARCH = 40
+
+
+class IndexedPGVector(PGVector):
+    """
+    可使用ANN索引的PGVector
+    
+    LangChain的 embedding 列没有固定维度，HNSW/IVFFlat 索引只能建在
+    (embedding::vector(N)) 表达式上（见 VectorIndexManager）。无过滤查询按同一
+    表达式排序以命中索引，并在查询事务内设置 hnsw.ef_search / ivfflat.probes。
+    
+    所有集合（各代际、章节索引）共用 langchain_pg_embedding 上的同一个ANN索引，
+    collection_id 只能在索引扫描之后过滤：索引只返回 ef_search 个近邻，其中属于
+    其他集合的行被过滤掉后结果可能不足 k 条。因此ANN查询把 ef_search 提到
+    不低于 LIMIT，并在 pgvector >= 0.8 上开启迭代扫描（iterative_scan），
+    过滤后不足时继续扫描索引。
+    
+    带过滤条件的查询先用 source_type / platform / priority 生成列上的B树索引
+    缩小候选集，再只对命中的行计算精确距离；过滤越严格，查询越快。生成列和
+    元数据索引需先用 scripts/manage_vector_index.py metadata 建立。
+    
+    设置 partitions 后（需用 VectorIndexManager 建立按 source_type 的部分索引），
+    限定来源类型的查询只走对应分区的ANN索引，无过滤查询对各分区（以及
+    source_type 为空或不在分区列表中的行）分别取 top-k 后 UNION ALL 合并。
+    
+    quantization="float16" 时ANN查询按 (embedding::halfvec(N)) 上的索引粗排
+    k * rerank_factor 个候选，再按原向量精确重排（需先建 --halfvec 索引）。
+    """
+    
+    def __init__(
+        self,
+        *args,
+        dimension: int = 1536,
+        partitions: Optional[List[str]] = None,
+        quantization: str = "none",
+        rerank_factor: int = 4,
+        iterative_scan: str = "relaxed_order",
+        **kwargs
+    ):
+        if quantization not in ("none", "float16"):
+            raise ValueError(f"Unsupported quantization for pgvector: {quantization}")
+        if iterative_scan not in ("off", "relaxed_order", "strict_order"):
+            raise ValueError(f"Unsupported iterative scan mode: {iterative_scan}")
+        self.dimension = dimension
+        self.partitions = partitions
+        self.quantization = quantization
+        self.rerank_factor = max(int(rerank_factor), 1)
+        self.iterative_scan = iterative_scan
+        self._collection_id = None
+        self._promoted_columns: set = set()
+        self._supports_iterative_scan = False
+        super().__init__(*args, **kwargs)
+    
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        self._promoted_columns = self._load_promoted_columns()
+        self._supports_iterative_scan = self._load_supports_iterative_scan()
+    
+    def _load_promoted_columns(self) -> set:
+        """
+        已建立的元数据生成列
+        
+        生成列和元数据索引是一次性迁移（scripts/manage_vector_index.py metadata），
+        不在这里执行DDL；未迁移时过滤条件直接读 cmetadata，结果相同，只是没有索引。
+        """
+        with Session(self._bind) as session:
+            rows = session.execute(
+                text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_name = 'langchain_pg_embedding' "
+                    "AND column_name = ANY(CAST(:columns AS text[]))"
+                ),
+                {"columns": list(PROMOTED_METADATA_COLUMNS)}
+            ).fetchall()
+        return {row.column_name for row in rows}
+    
+    def _load_supports_iterative_scan(self) -> bool:
+        """pgvector 0.8 起支持 hnsw/ivfflat.iterative_scan，旧版本设置该参数会报错"""
+        with Session(self._bind) as session:
+            version = session.execute(
+                text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            ).scalar()
+        try:
+            return tuple(int(part) for part in str(version).split(".")[:2]) >= (0, 8)
+        except ValueError:
+            return False
+    
+    def _metadata_column(self, key: str) -> str:
+        """过滤字段对应的SQL表达式（key 来自 PROMOTED_METADATA_COLUMNS 白名单）"""
+        if key in self._promoted_columns:
+            return key
+        return f"(cmetadata->>'{key}')"
+    
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按 (source, chunk_index) 一次查询批量取文档块"""
+        if not keys:
+            return []
+        
+        with Session(self._bind) as session:
+            rows = session.execute(
+                text("""
+                    SELECT e.document, e.cmetadata
+                    FROM langchain_pg_embedding e
+                    JOIN unnest(CAST(:sources AS text[]), CAST(:chunk_indexes AS text[]))
+                         AS k(source, chunk_index)
+                      ON e.cmetadata->>'source' = k.source
+                     AND e.cmetadata->>'chunk_index' = k.chunk_index
+                    WHERE e.collection_id = :collection_id
+                """),
+                {
+                    "collection_id": self._get_collection_id(session),
+                    "sources": [source for source, _ in keys],
+                    "chunk_indexes": [str(index) for _, index in keys]
+                }
+            ).fetchall()
+        return [
+            Document(page_content=row.document, metadata=row.cmetadata or {})
+            for row in rows
+        ]
+    
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Document]:
+        """按批流式读取集合中的全部文档块（不读向量），用于重建关键词索引"""
+        with Session(self._bind) as session:
+            result = session.execute(
+                text(
+                    "SELECT document, cmetadata FROM langchain_pg_embedding "
+                    "WHERE collection_id = :collection_id"
+                ),
+                {"collection_id": self._get_collection_id(session)},
+                execution_options={"stream_results": True}
+            )
+            for rows in result.partitions(batch_size):
+                for row in rows:
+                    yield Document(page_content=row.document, metadata=row.cmetadata or {})
+    
+    def delete_by_source(self, source: Union[str, List[str]], prefix: bool = False) -> int:
+        """单条DELETE按来源（来源列表或来源前缀）批量删除，返回删除的行数"""
+        if prefix:
+            escaped = source.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            condition = "cmetadata->>'source' LIKE :source"
+            value = escaped + "%"
+        elif not isinstance(source, str):
+            condition = "cmetadata->>'source' = ANY(CAST(:source AS text[]))"
+            value = list(source)
+        else:
+            condition = "cmetadata->>'source' = :source"
+            value = source
+        
+        with Session(self._bind) as session:
+            result = session.execute(
+                text(
+                    f"DELETE FROM langchain_pg_embedding "
+                    f"WHERE collection_id = :collection_id AND {condition}"
+                ),
+                {"collection_id": self._get_collection_id(session), "source": value}
+            )
+            session.commit()
+            return result.rowcount
+    
+    def stats(self) -> List[Dict]:
+        """按 source_type 聚合文档数、块数和最后写入时间"""
+        with Session(self._bind) as session:
+            rows = session.execute(
+                text("""
+                    SELECT cmetadata->>'source_type' AS source_type,
+                           COUNT(DISTINCT cmetadata->>'source') AS documents,
+                           COUNT(*) AS chunks,
+                           MAX(cmetadata->>'ingested_at') AS last_updated
+                    FROM langchain_pg_embedding
+                    WHERE collection_id = :collection_id
+                    GROUP BY 1
+                """),
+                {"collection_id": self._get_collection_id(session)}
+            ).fetchall()
+        return [dict(row._mapping) for row in rows]
+    
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        return_embeddings: bool = False
+    ) -> List[Tuple]:
+        """按向量检索top-k，可按查询指定ANN参数；return_embeddings=True 时附带向量"""
+        filter = dict(filter or {})
+        # source_type 的排除条件（如两阶段检索中“非手册”的一路）在下面单独处理
+        excluded = _excluded_values(filter.get("source_type"))
+        if excluded is not None:
+            del filter["source_type"]
+        
+        # 复杂过滤条件（$in/$between等）交给LangChain原实现
+        if any(isinstance(v, dict) for v in filter.values()):
+            if excluded is not None:
+                filter["source_type"] = {"$nin": excluded}
+            if not return_embeddings:
+                return super().similarity_search_with_score_by_vector(embedding, k, filter)
+            rows = self._PGVector__query_collection(embedding=embedding, k=k, filter=filter)
+            return [
+                (
+                    Document(
+                        page_content=row.EmbeddingStore.document,
+                        metadata=row.EmbeddingStore.cmetadata or {}
+                    ),
+                    float(row.distance),
+                    _parse_vector(row.EmbeddingStore.embedding)
+                )
+                for row in rows
+            ]
+        
+        operator = _DISTANCE_OPERATORS[self._distance_strategy]
+        query_vector = f"CAST(:query AS vector({self.dimension}))"
+        ann_distance = f"(embedding::vector({self.dimension})) {operator} {query_vector}"
+        
+        source_type = filter.get("source_type") or source_type_for(filter.get("source"))
+        if self.partitions and source_type in self.partitions:
+            # 分区模式：只按来源类型过滤时走该分区的部分ANN索引；
+            # 指定了具体来源时候选很少，仍走B树 + 精确距离（ANN后过滤可能丢行）
+            filter["source_type"] = source_type
+            partition_only = set(filter) == {"source_type"}
+        else:
+            partition_only = False
+        
+        if not filter or partition_only:
+            # 排除条件通常只去掉一小部分行，走ANN索引并在扫描后过滤
+            distance = ann_distance
+        else:
+            # 直接使用原始列排序，规划器不会选用ANN表达式索引，
+            # 而是先走过滤字段的B树索引，再对候选行计算精确距离
+            distance = f"embedding {operator} {query_vector}"
+        
+        conditions = ["collection_id = :collection_id"]
+        params = {
+            "query": "[" + ",".join(str(float(x)) for x in embedding) + "]",
+            "k": k
+        }
+        for i, (key, value) in enumerate(filter.items()):
+            if key == "source_type" and partition_only:
+                # 部分索引的谓词必须字面匹配，分区名来自配置白名单，可直接内联
+                conditions.append(f"{self._metadata_column('source_type')} = '{source_type}'")
+                continue
+            # 列表值表示取其中任一值
+            if isinstance(value, (list, tuple, set)):
+                comparison = f"= ANY(CAST(:value_{i} AS text[]))"
+                params[f"value_{i}"] = [str(v) for v in value]
+            else:
+                comparison = f"= :value_{i}"
+                params[f"value_{i}"] = str(value)
+            if key in PROMOTED_METADATA_COLUMNS:
+                conditions.append(f"{self._metadata_column(key)} {comparison}")
+            elif key == "source":
+                conditions.append(f"cmetadata->>'source' {comparison}")
+            else:
+                conditions.append(f"cmetadata->>:key_{i} {comparison}")
+                params[f"key_{i}"] = key
+        
+        # 分区模式下无其他过滤条件时，排除条件由下面的分区分路实现
+        partition_branches = bool(self.partitions) and not filter
+        if excluded is not None:
+            column = self._metadata_column("source_type")
+            params["excluded"] = excluded
+            if not partition_branches:
+                conditions.append(f"({column} IS NULL OR {column} <> ALL(CAST(:excluded AS text[])))")
+        
+        use_ann = distance == ann_distance
+        ann_limit = k * self.rerank_factor if self.quantization == "float16" else k
+        if use_ann:
+            # 索引扫描只产出 ef_search 个近邻，collection_id 等条件在扫描后过滤，
+            # ef_search 小于 LIMIT 时结果必然不足
+            ef_search = max(int(ef_search or _DEFAULT_EF_SEARCH), ann_limit)
+        
+        with Session(self._bind) as session:
+            params["collection_id"] = self._get_collection_id(session)
+            
+            # SET LOCAL只在当前事务内生效，不影响连接池中的其他查询
+            if ef_search:
+                session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+            if probes:
+                session.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+            if use_ann and self.iterative_scan != "off" and self._supports_iterative_scan:
+                # 过滤后不足 LIMIT 时继续扫描索引；ivfflat 只支持 relaxed_order
+                session.execute(text(f"SET LOCAL hnsw.iterative_scan = {self.iterative_scan}"))
+                session.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+            
+            # 向量列体积大，只在需要时返回
+            extra_columns = ", embedding" if return_embeddings else ""
+            where_clauses = [" AND ".join(conditions)]
+            if partition_branches:
+                # 每个分区（排除的除外）各自走部分ANN索引取top-k，再合并成全局top-k；
+                # 没有或不在分区列表中的 source_type 单独一路，与本地分区索引的
+                # default 分区一致，不会被漏掉
+                column = self._metadata_column("source_type")
+                partition_list = ", ".join(f"'{partition}'" for partition in self.partitions)
+                rest = f"({column} IS NULL OR {column} NOT IN ({partition_list}))"
+                if excluded is not None:
+                    rest = f"({rest} AND ({column} IS NULL OR {column} <> ALL(CAST(:excluded AS text[]))))"
+                where_clauses = [
+                    f"{where_clauses[0]} AND {column} = '{partition}'"
+                    for partition in self.partitions
+                    if partition not in (excluded or ())
+                ] + [f"{where_clauses[0]} AND {rest}"]
+            
+            if self.quantization == "float16" and distance == ann_distance:
+                # 先按halfvec索引粗排取候选，再用原向量精确重排
+                coarse = (
+                    f"(embedding::halfvec({self.dimension})) {operator} "
+                    f"CAST(:query AS halfvec({self.dimension}))"
+                )
+                params["candidates"] = k * self.rerank_factor
+                branches = [
+                    f"(SELECT document, cmetadata, embedding FROM langchain_pg_embedding "
+                    f"WHERE {where} ORDER BY {coarse} LIMIT :candidates)"
+                    for where in where_clauses
+                ]
+                statement = (
+                    f"SELECT document, cmetadata{extra_columns}, "
+                    f"embedding {operator} {query_vector} AS distance "
+                    f"FROM ({' UNION ALL '.join(branches)}) AS shortlist "
+                    f"ORDER BY distance LIMIT :k"
+                )
+            else:
+                branches = [
+                    f"SELECT document, cmetadata{extra_columns}, {distance} AS distance "
+                    f"FROM langchain_pg_embedding "
+                    f"WHERE {where} ORDER BY {distance} LIMIT :k"
+                    for where in where_clauses
+                ]
+                if len(branches) == 1:
+                    statement = branches[0]
+                else:
+                    statement = (
+                        " UNION ALL ".join(f"({branch})" for branch in branches)
+                        + " ORDER BY distance LIMIT :k"
+                    )
+            
+            rows = session.execute(text(statement), params).fetchall()
+            session.commit()
+        
+        if use_ann and self.iterative_scan == "relaxed_order":
+            # relaxed_order 下索引扫描的输出顺序只是近似的
+            rows = sorted(rows, key=lambda row: row.distance)
+        
+        results = []
+        for row in rows:
+            result = (
+                Document(page_content=row.document, metadata=row.cmetadata or {}),
+                float(row.distance)
+            )
+            if return_embeddings:
+                result += (_parse_vector(row.embedding),)
+            results.append(result)
+        return results
+    
+    def drop(self) -> None:
+        """删除整个集合（级联删除其中的向量）"""
+        self.delete_collection()
+        self._collection_id = None
+    
+    def _get_collection_id(self, session: Session):
+        """集合ID在实例生命周期内不变，缓存起来省一次查询"""
+        if self._collection_id is None:
+            collection = self.get_collection(session)
+            if not collection:
+                raise ValueError("Collection not found")
+            self._collection_id = collection.uuid
+        return self._collection_id
+
+
+def create_vector_store(embeddings, generation: Optional[str] = None):
+    """
+    根据配置创建向量存储
+    
+    generation 为索引代际（见 index_generations），None 为默认集合 / 目录。
+    """
+    backend = settings.VECTOR_STORE_BACKEND.lower()
+    
+    if backend == "pgvector":
+        quantization = settings.VECTOR_QUANTIZATION
+        if quantization == "int8":
+            # pgvector没有int8向量类型，退化为halfvec
+            logger.warning("pgvector does not support int8 vectors, using float16 instead")
+            quantization = "float16"
+        return IndexedPGVector(
+            connection_string=settings.DATABASE_URL,
+            embedding_function=embeddings,
+            collection_name=collection_name("knowledge_base", generation),
+            distance_strategy=(
+                DistanceStrategy.MAX_INNER_PRODUCT
+                if settings.VECTOR_DISTANCE == "inner_product"
+                else DistanceStrategy.COSINE
+            ),
+            engine_args={
+                "pool_size": settings.DB_POOL_SIZE,
+                "max_overflow": settings.DB_MAX_OVERFLOW,
+                "pool_pre_ping": True
+            },
+            dimension=settings.EMBEDDING_DIMENSION,
+            partitions=(
+                list(SOURCE_TYPE_PREFIXES.values())
+                if settings.VECTOR_PARTITION_BY_SOURCE_TYPE
+                else None
+            ),
+            quantization=quantization,
+            rerank_factor=settings.VECTOR_RERANK_FACTOR,
+            iterative_scan=settings.VECTOR_INDEX_ITERATIVE_SCAN
+        )
+    elif backend == "numpy":
+        store_class = (
+            PartitionedVectorStore
+            if settings.VECTOR_PARTITION_BY_SOURCE_TYPE
+            else NumpyVectorStore
+        )
+        return store_class(
+            embedding_function=embeddings,
+            persist_path=str(generation_path(generation)),
+            distance_strategy=settings.VECTOR_DISTANCE,
+            quantization=settings.VECTOR_QUANTIZATION,
+            quantization_dims=settings.VECTOR_QUANTIZATION_DIMS,
+            rerank_factor=settings.VECTOR_RERANK_FACTOR
+        )
+    else:
+        raise ValueError(f"Unsupported vector store backend: {backend}")
+
+
+def create_section_store(embeddings, generation: Optional[str] = None):
+    """
+    创建章节级粗索引（每个手册章节一个 标题+摘要 向量）
+    
+    与块索引使用同一后端和代际：numpy 存在索引目录下的 sections 子目录，
+    pgvector 使用独立集合 knowledge_sections。
+    """
+    backend = settings.VECTOR_STORE_BACKEND.lower()
+    
+    if backend == "pgvector":
+        return IndexedPGVector(
+            connection_string=settings.DATABASE_URL,
+            embedding_function=embeddings,
+            collection_name=collection_name("knowledge_sections", generation),
+            distance_strategy=(
+                DistanceStrategy.MAX_INNER_PRODUCT
+                if settings.VECTOR_DISTANCE == "inner_product"
+                else DistanceStrategy.COSINE
+            ),
+            engine_args={"pool_size": 1, "max_overflow": 2, "pool_pre_ping": True},
+            dimension=settings.EMBEDDING_DIMENSION,
+            iterative_scan=settings.VECTOR_INDEX_ITERATIVE_SCAN
+        )
+    elif backend == "numpy":
+        return NumpyVectorStore(
+            embedding_function=embeddings,
+            persist_path=str(generation_path(generation) / "sections"),
+            distance_strategy=settings.VECTOR_DISTANCE
+        )
+    else:
+        raise ValueError(f"Unsupported vector store backend: {backend}")
+
+
+def drop_generation_collections(generations: List[str]) -> int:
+    """
+    按集合名删除代际的PGVector集合（外键级联删除其中的向量）
+    
+    不打开集合，因此不会建表、建集合或执行索引DDL；numpy后端的数据在
+    代际目录中，由 remove_generation_files 删除。返回删除的集合数。
+    """
+    if settings.VECTOR_STORE_BACKEND.lower() != "pgvector" or not generations:
+        return 0
+    
+    names = [
+        collection_name(base, generation)
+        for generation in generations
+        for base in ("knowledge_base", "knowledge_sections")
+    ]
+    engine = create_engine(settings.DATABASE_URL, poolclass=NullPool)
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(
+                text("DELETE FROM langchain_pg_collection WHERE name = ANY(CAST(:names AS text[]))"),
+                {"names": names}
+            )
+            return result.rowcount
+    finally:
+        engine.dispose()
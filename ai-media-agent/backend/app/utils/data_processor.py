@@ -3,9 +3,21 @@
 """
 import re
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from pathlib import Path
 
+# 预编译的清洗规则
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_SPECIAL_CHAR_PATTERN = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9\s\.,!?;:""''()【】\-]')
+
+# 手册排版噪声
+_IMAGE_PLACEHOLDER_PATTERN = re.compile(r'\[图片\]')
+# 作者标记：#head 98589；瓜斯 #end -> @瓜斯
+_AUTHOR_MARKUP_PATTERN = re.compile(r'#head\s*\d+\s*[；;]\s*(.+?)\s*#end')
+_ZSXQ_LINK_PATTERN = re.compile(r'https?://t\.zsxq\.com/[A-Za-z0-9]+')
+_TRAILING_SPACE_PATTERN = re.compile(r'[ \t\u3000]+\n')
+_BLANK_LINES_PATTERN = re.compile(r'\n{3,}')
+
 
 class DataProcessor:
     """数据处理工具类"""
@@ -17,13 +29,48 @@ class DataProcessor:
             return ""
         
         # 移除多余的空白字符
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_PATTERN.sub(' ', text)
         
         # 移除特殊字符（保留中文、英文、数字、常用标点）
-        text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s\.,!?;:""''()【】\-]', '', text)
+        text = _SPECIAL_CHAR_PATTERN.sub('', text)
         
         return text.strip()
     
+    @staticmethod
+    def normalize_manual_text(text: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        去除手册/社群帖子中的排版噪声
+        
+        与 clean_text 不同，这里保留换行和标点，只处理：
+        [图片] 占位符（删除）、#head ID；昵称 #end 作者标记（改写为 @昵称）、
+        t.zsxq.com 链接（删除），以及行尾空白和多余空行。
+        
+        Returns:
+            (清洗后的文本, 被移除内容的记录；没有移除任何内容时为空字典)
+        """
+        if not text:
+            return "", {}
+        
+        removed: Dict[str, Any] = {}
+        
+        text, images = _IMAGE_PLACEHOLDER_PATTERN.subn('', text)
+        if images:
+            removed["images"] = images
+        
+        authors = _AUTHOR_MARKUP_PATTERN.findall(text)
+        if authors:
+            text = _AUTHOR_MARKUP_PATTERN.sub(lambda m: f"@{m.group(1)}", text)
+            removed["authors"] = authors
+        
+        links = _ZSXQ_LINK_PATTERN.findall(text)
+        if links:
+            text = _ZSXQ_LINK_PATTERN.sub('', text)
+            removed["links"] = links
+        
+        text = _TRAILING_SPACE_PATTERN.sub('\n', text)
+        text = _BLANK_LINES_PATTERN.sub('\n\n', text)
+        return text.strip(), removed
+    
     @staticmethod
     def extract_manual_metadata(content: str) -> Dict[str, Any]:
         """从手册内容中提取元数据"""
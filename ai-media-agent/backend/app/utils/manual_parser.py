@@ -0,0 +1,79 @@
+"""
+航海手册流式解析
+"""
+import mmap
+import re
+from pathlib import Path
+from typing import Iterator, Tuple
+
+# 章节标题行：以 ## 开头，或以「第」开头且包含「章」/「节」
+_HEADING_PATTERN = re.compile(rb"^(?:##|\xe7\xac\xac)[^\n]*", re.MULTILINE)
+_CHAPTER_MARKS = ("章".encode("utf-8"), "节".encode("utf-8"))
+_NON_SPACE_PATTERN = re.compile(rb"\S")
+
+
+class ManualParser:
+    """
+    基于内存映射的手册章节解析器
+    
+    用一个预编译的多行正则在mmap上顺序查找标题行，整体线性时间；
+    sections() 只产出 (标题, 正文起始偏移, 正文结束偏移)，正文在
+    text() 中按需切片解码，常驻内存与文件大小无关。
+    
+    用法:
+        with ManualParser(path) as parser:
+            for title, start, end in parser.sections():
+                content = parser.text(start, end)
+    """
+    
+    def __init__(self, path: str, first_title: str = "开始"):
+        self.path = Path(path)
+        self.first_title = first_title
+        self._file = None
+        self._map = None
+    
+    def __enter__(self) -> "ManualParser":
+        self._file = open(self.path, "rb")
+        # 空文件不能映射
+        if self.path.stat().st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        self._file = None
+    
+    def sections(self) -> Iterator[Tuple[str, int, int]]:
+        """
+        逐个产出章节 (标题, 正文起始字节偏移, 正文结束字节偏移)
+        
+        标题行本身不计入正文；正文只有空白的章节会被跳过。
+        """
+        if self._map is None:
+            return
+        
+        title = self.first_title
+        start = 0
+        for match in _HEADING_PATTERN.finditer(self._map):
+            line = match.group()
+            if line.startswith(b"##") or any(mark in line for mark in _CHAPTER_MARKS):
+                if self._has_content(start, match.start()):
+                    yield title, start, match.start()
+                title = line.decode("utf-8", errors="replace").strip()
+                start = match.end() + 1
+        
+        end = len(self._map)
+        if self._has_content(start, end):
+            yield title, start, end
+    
+    def text(self, start: int, end: int) -> str:
+        """解码一个章节的正文"""
+        if self._map is None:
+            return ""
+        return self._map[start:end].decode("utf-8", errors="replace").strip()
+    
+    def _has_content(self, start: int, end: int) -> bool:
+        return start < end and _NON_SPACE_PATTERN.search(self._map, start, end) is not None
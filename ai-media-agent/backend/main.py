@@ -9,6 +9,7 @@ import uvicorn
 from app.core.config import settings
 from app.api.v1.router import api_router
 from app.db.init_db import init_db
+from app.services.container import ServiceContainer
 from app.core.logging import setup_logging
 
 # 设置日志
@@ -21,9 +22,12 @@ async def lifespan(app: FastAPI):
     # 启动时
     print("🚀 Starting AI Media Agent...")
     await init_db()
+    app.state.services = ServiceContainer()
+    app.state.services.start()
     yield
     # 关闭时
     print("👋 Shutting down AI Media Agent...")
+    await app.state.services.close()
 
 
 app = FastAPI(
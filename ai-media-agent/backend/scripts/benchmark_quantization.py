@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+向量压缩的召回率 / 内存评估脚本
+
+从知识库已有的向量中抽样作为查询，以float32精确检索为基准，
+比较各压缩配置的 recall@k、常驻内存和单次查询耗时。
+
+用法:
+    python scripts/benchmark_quantization.py
+    python scripts/benchmark_quantization.py --index-path ./vector_index --k 10 --queries 200
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.index_generations import active_generation, generation_path
+from app.services.vector_store import NumpyVectorStore
+
+# (quantization, PCA维数, rerank_factor)
+CONFIGS = [
+    ("float16", None, 1),
+    ("float16", None, 4),
+    ("int8", None, 1),
+    ("int8", None, 4),
+    ("int8", 512, 4),
+    ("int8", 256, 4),
+    ("int8", 256, 10),
+]
+
+
+def main_store_files(index_path: str) -> List[Path]:
+    """
+    当前生效代际的块索引文件（含分区子目录）
+    
+    不读取旧代际和 sections 章节索引，否则同一批向量会重复计入语料。
+    """
+    # 代际指针和代际目录都相对 --index-path 解析
+    settings.VECTOR_STORE_PATH = index_path
+    root = generation_path(active_generation())
+    files = [root / "embeddings.npy"] + sorted(root.glob("*/embeddings.npy"))
+    return [f for f in files if f.exists() and f.parent.name != "sections"]
+
+
+def load_vectors(index_path: str, cache_path: str) -> np.ndarray:
+    """优先读取当前代际的numpy索引，否则读取向量缓存"""
+    files = main_store_files(index_path)
+    if files:
+        return np.concatenate([np.load(f) for f in files]).astype(np.float32)
+    
+    if Path(cache_path).exists():
+        conn = sqlite3.connect(cache_path)
+        rows = conn.execute(
+            "SELECT vector FROM embeddings WHERE model = ?",
+            (settings.EMBEDDING_MODEL,)
+        ).fetchall()
+        conn.close()
+        if rows:
+            return np.stack([np.frombuffer(blob, dtype=np.float32) for (blob,) in rows])
+    
+    return np.zeros((0, 0), dtype=np.float32)
+
+
+def build_store(vectors: np.ndarray, quantization: str, dims, rerank_factor: int) -> NumpyVectorStore:
+    store = NumpyVectorStore(
+        embedding_function=None,
+        distance_strategy=settings.VECTOR_DISTANCE,
+        quantization=quantization,
+        quantization_dims=dims,
+        rerank_factor=rerank_factor
+    )
+    store.add_embeddings(
+        [str(i) for i in range(len(vectors))],
+        vectors,
+        [{"row": i} for i in range(len(vectors))]
+    )
+    return store
+
+
+def run_queries(store: NumpyVectorStore, queries: np.ndarray, k: int):
+    """返回每个查询的top-k行号和平均耗时(ms)"""
+    # 预热一次，把压缩向量的生成排除在计时之外
+    store.similarity_search_with_score_by_vector(queries[0], k)
+    
+    results = []
+    started = time.perf_counter()
+    for query in queries:
+        hits = store.similarity_search_with_score_by_vector(query, k)
+        results.append({int(doc.page_content) for doc, _ in hits})
+    elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    return results, elapsed_ms
+
+
+def format_size(size_bytes: float) -> str:
+    """格式化字节数"""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size_bytes < 1024:
+            return f"{size_bytes:.1f}{unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f}TB"
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="评估向量压缩的召回率与内存")
+    parser.add_argument("--index-path", default=settings.VECTOR_STORE_PATH)
+    parser.add_argument("--cache-path", default=settings.EMBEDDING_CACHE_PATH)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="查询向量上叠加的噪声幅度")
+    args = parser.parse_args()
+    
+    vectors = load_vectors(args.index_path, args.cache_path)
+    if len(vectors) <= args.k:
+        print("❌ Not enough vectors, run scripts/init_data.py first")
+        return False
+    
+    # 以语料向量加噪声作为查询，避免查询与某一行完全相同
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[sample] + rng.normal(scale=args.noise, size=(len(sample), vectors.shape[1])) * np.abs(vectors[sample]).mean()
+    queries = queries.astype(np.float32)
+    
+    print(f"📊 Corpus: {len(vectors)} vectors x {vectors.shape[1]} dims, "
+          f"{len(queries)} queries, k={args.k}")
+    
+    exact = build_store(vectors, "none", None, 1)
+    truth, exact_ms = run_queries(exact, queries, args.k)
+    exact_bytes = exact.memory_usage()["full_precision"]
+    
+    print(f"\n{'config':<26}{'recall@k':>10}{'resident':>12}{'ratio':>8}{'ms/query':>10}")
+    print(f"{'float32 exact':<26}{1.0:>10.3f}{format_size(exact_bytes):>12}{1.0:>8.2f}{exact_ms:>10.2f}")
+    
+    for quantization, dims, rerank_factor in CONFIGS:
+        store = build_store(vectors, quantization, dims, rerank_factor)
+        results, elapsed_ms = run_queries(store, queries, args.k)
+        recall = np.mean([len(r & t) / len(t) for r, t in zip(results, truth)])
+        
+        # 常驻内存只计压缩向量：从磁盘加载时float32原向量走mmap
+        resident = store.memory_usage()["codes"]
+        label = f"{quantization}{f'/pca{dims}' if dims else ''} x{rerank_factor}"
+        print(f"{label:<26}{recall:>10.3f}{format_size(resident):>12}"
+              f"{resident / exact_bytes:>8.2f}{elapsed_ms:>10.2f}")
+    
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
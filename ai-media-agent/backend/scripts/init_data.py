@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 """
 初始化知识库数据脚本
+
+用法:
+    python scripts/init_data.py          # 增量导入，只处理新增/变化/删除的内容
+    python scripts/init_data.py --full   # 在新索引中全量重建，完成后切换
+
+运行中的服务进程会在 INDEX_WATCH_INTERVAL 秒内跟随切换到新索引，旧索引等
+所有服务进程切走后才回收，重建期间检索不受影响。
 """
+import argparse
 import asyncio
 import sys
 import os
@@ -19,6 +27,10 @@ from app.core.logging import setup_logging
 
 async def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="初始化知识库")
+    parser.add_argument("--full", action="store_true", help="在新索引中全量重建，完成后切换（忽略增量清单）")
+    args = parser.parse_args()
+    
     # 设置日志
     setup_logging()
     
@@ -57,7 +69,11 @@ async def main():
     
     # 加载知识库
     loader = KnowledgeLoader()
-    success = await loader.load_all()
+    if args.full:
+        success = await loader.rebuild_index()
+    else:
+        print(f"♻️  Incremental load, {len(loader.manifest)} sources already ingested")
+        success = await loader.load_all()
     
     if success:
         print("✅ Knowledge base initialization completed!")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+向量索引管理脚本
+
+用法:
+    python scripts/manage_vector_index.py list
+    python scripts/manage_vector_index.py create --method hnsw --m 16 --ef-construction 64
+    python scripts/manage_vector_index.py create --method ivfflat --lists 1000
+    python scripts/manage_vector_index.py drop --method hnsw
+    python scripts/manage_vector_index.py create --method hnsw --partitioned   # 需先执行 metadata
+    python scripts/manage_vector_index.py create --method hnsw --halfvec
+    python scripts/manage_vector_index.py metadata   # 一次性迁移：元数据过滤列和索引
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.vector_index import (
+    INDEXABLE_TABLES,
+    INDEX_METHODS,
+    INDEX_PARTITIONS,
+    VectorIndexManager
+)
+from app.core.logging import setup_logging
+
+
+def format_size(size_bytes: int) -> str:
+    """格式化字节数"""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size_bytes < 1024:
+            return f"{size_bytes:.1f}{unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f}TB"
+
+
+def print_index(info: dict):
+    """打印索引信息"""
+    print(f"   - {info['name']} ({info.get('method')}) on {info.get('table_name')}: "
+          f"{format_size(info.get('size_bytes', 0))}")
+    if "build_seconds" in info:
+        print(f"     build time: {info['build_seconds']}s")
+
+
+async def main():
+    """主函数"""
+    setup_logging()
+    
+    parser = argparse.ArgumentParser(description="管理pgvector ANN索引")
+    parser.add_argument("action", choices=["create", "drop", "list", "metadata"])
+    parser.add_argument("--method", choices=INDEX_METHODS, default="hnsw")
+    parser.add_argument("--table", choices=list(INDEXABLE_TABLES), default="langchain_pg_embedding")
+    parser.add_argument("--distance", choices=["cosine", "inner_product", "l2"], default=None)
+    parser.add_argument("--m", type=int, default=16, help="HNSW: 每个节点的连接数")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW: 构建候选列表大小")
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlat: 聚类数（默认 行数/1000）")
+    parser.add_argument("--blocking", action="store_true", help="不使用CONCURRENTLY（更快但会阻塞写入）")
+    parser.add_argument("--partitioned", action="store_true", help="按source_type分别建部分索引")
+    parser.add_argument("--halfvec", action="store_true", help="在float16压缩向量上建索引")
+    args = parser.parse_args()
+    
+    manager = VectorIndexManager()
+    partitions = INDEX_PARTITIONS if args.partitioned else (None,)
+    
+    try:
+        if args.action == "create":
+            for partition in partitions:
+                label = f" ({partition})" if partition else ""
+                print(f"🔨 Creating {args.method} index on {args.table}{label}...")
+                info = await manager.create_index(
+                    method=args.method,
+                    table=args.table,
+                    distance=args.distance,
+                    m=args.m,
+                    ef_construction=args.ef_construction,
+                    lists=args.lists,
+                    concurrently=not args.blocking,
+                    partition=partition,
+                    halfvec=args.halfvec
+                )
+                print("✅ Index created")
+                print_index(info)
+        
+        elif args.action == "drop":
+            for partition in partitions:
+                await manager.drop_index(
+                    method=args.method,
+                    table=args.table,
+                    concurrently=not args.blocking,
+                    partition=partition,
+                    halfvec=args.halfvec
+                )
+                name = manager.index_name(args.table, args.method, partition, args.halfvec)
+                print(f"✅ Index {name} dropped")
+        
+        elif args.action == "metadata":
+            # 首次执行会重写 langchain_pg_embedding（加生成列），请在维护窗口运行
+            print("🔨 Creating metadata filter columns and indexes...")
+            statements = await manager.create_metadata_indexes(concurrently=not args.blocking)
+            for statement in statements:
+                print(f"   - {statement}")
+            print("✅ Metadata indexes ready (restart the API to use the new columns)")
+        
+        else:
+            indexes = await manager.list_indexes()
+            print(f"📊 Vector indexes: {len(indexes)}")
+            for info in indexes:
+                print_index(info)
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Vector index {args.action} failed: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    sys.exit(0 if success else 1)
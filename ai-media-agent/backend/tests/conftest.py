@@ -0,0 +1,79 @@
+"""
+测试公共夹具
+
+所有测试使用numpy后端和确定性的假embedding，不依赖数据库和网络。
+"""
+import hashlib
+import os
+
+# 必须在导入 app 之前设置，Settings 在导入时读取环境变量
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("VECTOR_STORE_BACKEND", "numpy")
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+
+class FakeEmbeddings(Embeddings):
+    """按文本hash生成固定向量，相同文本总得到相同向量"""
+    
+    dimension = 32
+    
+    def __init__(self):
+        self.calls = []
+    
+    def vector(self, text: str):
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dimension).tolist()
+    
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self.vector(text) for text in texts]
+    
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def local_settings(tmp_path, monkeypatch):
+    """把索引、清单、缓存和知识库路径都指向临时目录"""
+    knowledge_base = tmp_path / "kb"
+    knowledge_base.mkdir()
+    index_root = tmp_path / "vector_index"
+    overrides = {
+        "VECTOR_STORE_BACKEND": "numpy",
+        "VECTOR_STORE_PATH": str(index_root),
+        "KEYWORD_INDEX_PATH": str(index_root / "keyword_index.pkl"),
+        "INGEST_MANIFEST_PATH": str(index_root / "manifest.json"),
+        "EMBEDDING_CACHE_PATH": str(tmp_path / "embedding_cache.db"),
+        "KNOWLEDGE_BASE_PATH": str(knowledge_base),
+        "MANUAL_PATH": str(knowledge_base / "manual.md"),
+        "QA_PATH": str(knowledge_base / "qa.json"),
+        "CASES_PATH": str(knowledge_base / "cases.csv"),
+        "VECTOR_PARTITION_BY_SOURCE_TYPE": False,
+        "VECTOR_QUANTIZATION": "none",
+        "INDEX_GC_DELAY": 0.0
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    return knowledge_base
+
+
+@pytest.fixture
+def rag_service(local_settings, fake_embeddings, monkeypatch):
+    """使用假embedding、不加载tokenizer的 RAGService"""
+    import app.services.rag_service as rag_module
+    
+    monkeypatch.setattr(rag_module, "OpenAIEmbeddings", lambda **kwargs: fake_embeddings)
+    monkeypatch.setattr(rag_module.RAGService, "_load_tokenizer", staticmethod(lambda: None))
+    service = rag_module.RAGService()
+    yield service
+    service.close()
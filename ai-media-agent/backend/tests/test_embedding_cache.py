@@ -0,0 +1,38 @@
+"""
+EmbeddingCache 测试
+"""
+import itertools
+from types import SimpleNamespace
+
+from app.services import embedding_cache
+from app.services.embedding_cache import EmbeddingCache
+
+
+def test_eviction_keeps_recently_used_entries(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(embedding_cache, "time", SimpleNamespace(time=lambda: float(next(clock))))
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put_many("m", {"a": [1.0], "b": [2.0]})
+    
+    # 命中的 a 在淘汰前写回 last_used，写入 c 时淘汰 b
+    assert cache.get_many("m", ["a"]) == {"a": [1.0]}
+    cache.put_many("m", {"c": [3.0]})
+    
+    assert set(cache.get_many("m", ["a", "b", "c"])) == {"a", "c"}
+    assert cache.count() == 2
+    cache.close()
+
+
+def test_row_count_survives_reopen_and_duplicate_puts(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(path, max_entries=3)
+    cache.put_many("m", {"a": [1.0], "b": [2.0]})
+    cache.put_many("m", {"a": [1.0]})
+    cache.close()
+    
+    cache = EmbeddingCache(path, max_entries=3)
+    cache.put_many("m", {"c": [3.0]})
+    
+    assert cache.count() == 3
+    assert set(cache.get_many("m", ["a", "b", "c"])) == {"a", "b", "c"}
+    cache.close()
@@ -0,0 +1,47 @@
+"""
+KeywordIndex（BM25）测试
+"""
+import pytest
+from langchain.schema import Document
+
+from app.services.keyword_index import KeywordIndex
+from app.services.rag_service import RAGService
+
+
+def docs(source, texts):
+    return [
+        Document(page_content=text, metadata={"source": source, "chunk_index": i})
+        for i, text in enumerate(texts)
+    ]
+
+
+def test_deleted_documents_do_not_count_towards_idf():
+    index = KeywordIndex()
+    index.add_documents(docs("keep", ["选题方法", "其他内容"] * 4))
+    fresh = KeywordIndex()
+    fresh.add_documents(docs("keep", ["选题方法", "其他内容"] * 4))
+    
+    # 墓碑未到重建阈值时仍留在倒排表里，不能影响打分
+    index.add_documents(docs("gone", ["选题技巧"]))
+    index.delete_by_source("gone")
+    
+    assert index.search("选题", k=1)[0]["score"] == pytest.approx(
+        fresh.search("选题", k=1)[0]["score"]
+    )
+
+
+class DocumentStore:
+    def __init__(self, documents):
+        self.documents = documents
+    
+    def iter_documents(self):
+        return iter(self.documents)
+
+
+def test_keyword_index_rebuilt_from_vector_store(tmp_path):
+    store = DocumentStore(docs("手册", ["选题方法", "变现路径"]))
+    
+    index = RAGService._load_keyword_index(str(tmp_path / "missing.pkl"), store)
+    
+    assert len(index) == 2
+    assert index.search("变现", k=1)[0]["content"] == "变现路径"
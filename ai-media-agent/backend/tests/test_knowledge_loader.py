@@ -0,0 +1,150 @@
+"""
+KnowledgeLoader 重建索引（蓝绿切换）测试
+"""
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+
+from app.core.config import settings
+from app.services.index_generations import (
+    active_generation,
+    list_generations,
+    record_in_use,
+    release_in_use
+)
+from app.services import knowledge_loader
+from app.services.knowledge_loader import KnowledgeLoader, _parse_case_list
+
+
+@pytest.fixture
+def knowledge_base(local_settings):
+    qa = [{"question": f"问题{i}", "answer": f"回答{i}"} for i in range(10)]
+    (local_settings / "qa.json").write_text(json.dumps(qa, ensure_ascii=False), encoding="utf-8")
+    (local_settings / "manual.md").write_text("## 选题\n选题内容\n## 变现\n变现内容\n", encoding="utf-8")
+    return local_settings
+
+
+@pytest_asyncio.fixture
+async def loaded(knowledge_base, rag_service):
+    assert await KnowledgeLoader(rag_service).load_all()
+    return rag_service
+
+
+async def search_sources(rag_service, query):
+    return [doc["metadata"]["source"] for doc in await rag_service.search(query, k=3)]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_swaps_generation_and_collects_old_one(loaded):
+    chunks = len(loaded.vector_store)
+    
+    assert await KnowledgeLoader(loaded).rebuild_index()
+    first = loaded.generation
+    
+    assert first is not None
+    assert active_generation() == first
+    assert list_generations() == [first]
+    assert len(loaded.vector_store) == chunks
+    assert await search_sources(loaded, "问题3")
+    
+    assert await KnowledgeLoader(loaded).rebuild_index()
+    
+    assert loaded.generation != first
+    assert list_generations() == [loaded.generation]
+
+
+@pytest.mark.asyncio
+async def test_failed_rebuild_keeps_serving_index(loaded, knowledge_base):
+    assert await KnowledgeLoader(loaded).rebuild_index()
+    generation = loaded.generation
+    
+    # 源数据被清空时新索引为空，不能切换过去
+    (knowledge_base / "qa.json").write_text("[]", encoding="utf-8")
+    (knowledge_base / "manual.md").unlink()
+    
+    assert not await KnowledgeLoader(loaded).rebuild_index()
+    assert loaded.generation == generation
+    assert active_generation() == generation
+    assert list_generations() == [generation]
+    assert await search_sources(loaded, "问题3")
+
+
+@pytest.mark.asyncio
+async def test_rebuild_waits_for_other_processes_before_collecting(loaded, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_WATCH_INTERVAL", 0.01)
+    assert await KnowledgeLoader(loaded).rebuild_index()
+    old = loaded.generation
+    
+    # 另一个服务进程还在用旧代际
+    record_in_use(old, "other-host-1")
+    rebuild = asyncio.create_task(KnowledgeLoader(loaded).rebuild_index())
+    while loaded.generation == old:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    
+    assert not rebuild.done()
+    assert old in list_generations()
+    
+    release_in_use("other-host-1")
+    assert await rebuild
+    assert list_generations() == [loaded.generation]
+
+
+def test_parse_case_list_accepts_literals_and_delimiters():
+    assert _parse_case_list("['ChatGPT', 'Gamma']") == ["ChatGPT", "Gamma"]
+    assert _parse_case_list("ChatGPT，Gamma、Midjourney") == ["ChatGPT", "Gamma", "Midjourney"]
+    assert _parse_case_list("[未闭合, 标签") == ["[未闭合", "标签"]
+    assert _parse_case_list("[]") is None
+    assert _parse_case_list("") is None
+
+
+@pytest.mark.asyncio
+async def test_failed_rebuild_leaves_cases_table_untouched(loaded, knowledge_base, monkeypatch):
+    replaced = []
+    
+    async def replace(table, rows):
+        replaced.append(rows)
+        return len(rows)
+    
+    monkeypatch.setattr(settings, "CASES_TABLE_SYNC_ENABLED", True)
+    monkeypatch.setattr(knowledge_loader, "replace_table_rows", replace)
+    cases = knowledge_base / "cases.csv"
+    cases.write_text(
+        "platform,account_name,title,ai_tools_used\n小红书,账号A,标题,\"['ChatGPT', 'Gamma']\"\n",
+        encoding="utf-8"
+    )
+    monkeypatch.setattr(settings, "CASES_PATH", str(cases))
+    
+    # 校验不通过、重建失败时案例表不能被替换
+    monkeypatch.setattr(settings, "INDEX_SWAP_MIN_RATIO", 2.0)
+    assert not await KnowledgeLoader(loaded).rebuild_index()
+    assert replaced == []
+    
+    monkeypatch.setattr(settings, "INDEX_SWAP_MIN_RATIO", 0.0)
+    assert await KnowledgeLoader(loaded).rebuild_index()
+    assert [row["ai_tools_used"] for row in replaced[0]] == [["ChatGPT", "Gamma"]]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_holds_ingest_lock_until_swap(loaded):
+    lock = asyncio.Lock()
+    old = loaded.generation
+    rebuild = asyncio.create_task(KnowledgeLoader(loaded).rebuild_index(lock))
+    while not lock.locked():
+        await asyncio.sleep(0)
+    
+    # 上传、帖子监听拿到锁时重建已经切换完成，写入的是新索引
+    async with lock:
+        assert loaded.generation != old
+    assert await rebuild
+
+
+def test_normalize_keeps_only_document_author_and_link(rag_service):
+    content = "#head 1；瓜斯 #end 说\n[图片]\n正文 https://t.zsxq.com/abc\n#head 2；乙 #end 回复 https://t.zsxq.com/xyz"
+    
+    [(text, _, metadata)] = KnowledgeLoader(rag_service)._normalize([(content, "帖子", {"source_type": "post"})])
+    
+    assert text == "@瓜斯 说\n\n正文\n@乙 回复"
+    assert metadata == {"source_type": "post", "author": "瓜斯", "link": "https://t.zsxq.com/abc"}
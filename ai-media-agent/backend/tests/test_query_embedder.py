@@ -0,0 +1,84 @@
+"""
+QueryEmbeddingBatcher 测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.query_embedder import QueryEmbeddingBatcher
+
+
+class RecordingEmbeddings:
+    """记录每次批量请求，包含 fail 中文本的批次整体报错"""
+    
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.batches = []
+    
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail & set(texts):
+            raise RuntimeError("embedding failed")
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_share_one_request():
+    embeddings = RecordingEmbeddings()
+    batcher = QueryEmbeddingBatcher(embeddings, max_wait=0.01)
+    
+    vectors = await asyncio.gather(*[batcher.embed(text) for text in ["a", "bb", "a", "ccc"]])
+    
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0]]
+    # 相同文本只请求一次
+    assert embeddings.batches == [["a", "bb", "ccc"]]
+
+
+@pytest.mark.asyncio
+async def test_max_batch_caps_request_size():
+    embeddings = RecordingEmbeddings()
+    batcher = QueryEmbeddingBatcher(embeddings, max_wait=0.05, max_batch=8)
+    
+    texts = [f"q{i}" for i in range(20)]
+    await asyncio.gather(*[batcher.embed(text) for text in texts])
+    
+    assert [len(batch) for batch in embeddings.batches] == [8, 8, 4]
+    assert sorted(text for batch in embeddings.batches for text in batch) == sorted(texts)
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_skip_requests():
+    embeddings = RecordingEmbeddings()
+    batcher = QueryEmbeddingBatcher(embeddings, max_wait=0, cache_size=2)
+    
+    await batcher.embed("a")
+    await batcher.embed("a")
+    assert len(embeddings.batches) == 1
+    assert batcher.stats()["hits"] == 1
+    
+    # 超出容量时淘汰最久未用的条目
+    await batcher.embed("b")
+    await batcher.embed("c")
+    await batcher.embed("a")
+    assert embeddings.batches[-1] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_failing_text_does_not_fail_its_batch():
+    embeddings = RecordingEmbeddings(fail={"bad"})
+    batcher = QueryEmbeddingBatcher(embeddings, max_wait=0.01)
+    
+    results = await asyncio.gather(
+        batcher.embed("ok"),
+        batcher.embed("bad"),
+        batcher.embed("ok2"),
+        return_exceptions=True
+    )
+    
+    assert results[0] == [2.0, 1.0]
+    assert isinstance(results[1], RuntimeError)
+    assert results[2] == [3.0, 1.0]
+    # 失败的文本不进入缓存，下次查询重新请求
+    assert "bad" not in batcher._cache
+    assert batcher.stats()["embedded"] == 2
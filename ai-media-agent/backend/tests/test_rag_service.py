@@ -0,0 +1,95 @@
+"""
+RAGService 测试
+"""
+import pytest
+
+from app.core.config import settings
+from app.services.rag_service import _stitch_chunks
+
+
+def result(source, chunk_index, content=None):
+    return {
+        "content": content or f"{source}#{chunk_index}",
+        "metadata": {"source": source, "chunk_index": chunk_index},
+        "score": 0.0
+    }
+
+
+def test_combine_results_fuses_by_rank(rag_service):
+    vector_results = [result("a", 0), result("b", 0), result("c", 0)]
+    keyword_results = [result("c", 0), result("d", 0)]
+    
+    combined = rag_service._combine_results(vector_results, keyword_results, alpha=0.6)
+    
+    # c 两路都命中，排名靠后也应超过只在一路中排第一的 a；同名次时向量结果权重更高
+    assert [doc["content"] for doc in combined] == ["c#0", "a#0", "b#0", "d#0"]
+    rrf_k = settings.RRF_K
+    assert combined[0]["score"] == pytest.approx(0.6 / (rrf_k + 3) + 0.4 / (rrf_k + 1))
+    assert combined[3]["score"] == pytest.approx(0.4 / (rrf_k + 2))
+
+
+def test_combine_results_weights_and_dedup(rag_service):
+    vector_results = [result("a", 0), result("a", 1)]
+    # 同一 (source, chunk_index) 只保留一条，内容以先出现的为准
+    keyword_results = [result("a", 1, content="关键词版本"), result("b", 0)]
+    
+    combined = rag_service._combine_results(vector_results, keyword_results, alpha=1.0)
+    
+    assert [doc["content"] for doc in combined][:2] == ["a#0", "a#1"]
+    assert len(combined) == 3
+    assert combined[-1]["score"] == 0.0
+
+
+def test_combine_results_tolerates_missing_leg(rag_service):
+    vector_results = [result("a", 0), result("b", 0)]
+    
+    combined = rag_service._combine_results(vector_results, None, alpha=0.7)
+    
+    assert [doc["content"] for doc in combined] == ["a#0", "b#0"]
+    assert rag_service._combine_results(None, None, alpha=0.7) == []
+
+
+def test_chunk_key_falls_back_to_content(rag_service):
+    doc = {"content": "无块索引", "metadata": {"source": "x"}}
+    assert rag_service._chunk_key(doc) == ("x", "无块索引")
+
+
+@pytest.mark.asyncio
+async def test_section_search_splits_corpus_between_legs(rag_service, fake_embeddings, monkeypatch):
+    manual = [
+        (f"章节{i}内容", f"航海手册-章节{i}", {"source_type": "manual", "section_title": f"章节{i}"})
+        for i in range(4)
+    ]
+    others = [(f"问答{i}", f"百问百答-{i}", {"source_type": "qa"}) for i in range(4)]
+    await rag_service.add_documents_bulk(manual + others)
+    await rag_service.add_sections([
+        (metadata["section_title"], content, {"source": source, **metadata})
+        for content, source, metadata in manual
+    ])
+    
+    filters = []
+    search = rag_service.vector_store.similarity_search_with_score_by_vector
+    
+    def recording_search(embedding, k=4, filter=None, **kwargs):
+        filters.append(filter)
+        return search(embedding, k=k, filter=filter, **kwargs)
+    
+    monkeypatch.setattr(rag_service.vector_store, "similarity_search_with_score_by_vector", recording_search)
+    results = await rag_service.search("章节1内容", k=8, sections=1, mmr=False, neighbors=0)
+    
+    # 手册一路只查选中的章节，另一路只查非手册来源，不再有全库检索
+    assert len(filters) == 2
+    selected = filters[0]["source"]
+    assert len(selected) == 1
+    assert filters[1] == {"source_type": {"$nin": ["manual"]}}
+    manual_sources = {doc["metadata"]["source"] for doc in results if doc["metadata"]["source_type"] == "manual"}
+    assert manual_sources == set(selected)
+    assert sum(doc["metadata"]["source_type"] == "qa" for doc in results) == 4
+
+
+def test_stitch_chunks_requires_real_overlap(monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP", 8)
+    
+    # 只有一个句号相同不算重叠
+    assert _stitch_chunks(["第一段结束了。", "。第二段"]) == "第一段结束了。\n。第二段"
+    assert _stitch_chunks(["前一块的结尾重叠部分", "结尾重叠部分以及后文"]) == "前一块的结尾重叠部分以及后文"
@@ -0,0 +1,139 @@
+"""
+NumpyVectorStore 测试
+"""
+import numpy as np
+import pytest
+
+from app.services.vector_store import NumpyVectorStore, PartitionedVectorStore
+
+
+def unit(*values):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector.tolist()
+
+
+@pytest.fixture
+def store(fake_embeddings, tmp_path):
+    store = NumpyVectorStore(fake_embeddings, persist_path=str(tmp_path / "index"))
+    store.add_embeddings(
+        ["手册一", "手册二", "问答一", "案例一"],
+        [unit(1, 0), unit(0.9, 0.1), unit(0, 1), unit(0.7, 0.7)],
+        [
+            {"source": "航海手册-一", "source_type": "manual", "chunk_index": 0},
+            {"source": "航海手册-一", "source_type": "manual", "chunk_index": 1},
+            {"source": "问答-1", "source_type": "qa", "chunk_index": 0},
+            {"source": "爆款案例-a", "source_type": "case", "chunk_index": 0, "platform": "抖音"}
+        ]
+    )
+    return store
+
+
+def contents(results):
+    return [doc.page_content for doc, *_ in results]
+
+
+def test_search_orders_by_distance(store):
+    results = store.similarity_search_with_score_by_vector(unit(1, 0), k=3)
+    
+    assert contents(results) == ["手册一", "手册二", "案例一"]
+    distances = [distance for _, distance in results]
+    assert distances == sorted(distances)
+    assert distances[0] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_search_applies_metadata_filter(store):
+    results = store.similarity_search_with_score_by_vector(
+        unit(1, 0), k=4, filter={"source_type": "qa"}
+    )
+    assert contents(results) == ["问答一"]
+    
+    results = store.similarity_search_with_score_by_vector(
+        unit(1, 0), k=4, filter={"source_type": ["qa", "case"]}
+    )
+    assert sorted(contents(results)) == ["案例一", "问答一"]
+    
+    assert store.similarity_search_with_score_by_vector(
+        unit(1, 0), k=4, filter={"platform": "小红书"}
+    ) == []
+    
+    
+    # 排除条件保留字段缺失的行
+    store.add_embeddings(["无类型"], [unit(1, 0)], [{"source": "其他"}])
+    results = store.similarity_search_with_score_by_vector(
+        unit(1, 0), k=5, filter={"source_type": {"$nin": ["manual"]}}
+    )
+    assert sorted(contents(results)) == ["无类型", "案例一", "问答一"]
+
+
+def test_search_returns_embeddings_on_request(store):
+    (_, _, embedding), = store.similarity_search_with_score_by_vector(
+        unit(0, 1), k=1, return_embeddings=True
+    )
+    assert np.allclose(embedding, unit(0, 1))
+
+
+def test_delete_by_source(store):
+    assert store.delete_by_source("航海手册-一") == 2
+    assert len(store) == 2
+    assert "手册一" not in contents(store.similarity_search_with_score_by_vector(unit(1, 0), k=4))
+    
+    assert store.delete_by_source("爆款案例-", prefix=True) == 1
+    assert contents(store.similarity_search_with_score_by_vector(unit(1, 0), k=4)) == ["问答一"]
+
+
+def test_filter_mask_tracks_later_writes(store):
+    # 先查询一次让过滤掩码被缓存，之后写入的行也必须能被过滤命中
+    store.similarity_search_with_score_by_vector(unit(0, 1), k=4, filter={"source_type": "qa"})
+    store.add_embeddings(["问答二"], [unit(0, 0.9, 0.1)], [{"source": "问答-2", "source_type": "qa"}])
+    
+    results = store.similarity_search_with_score_by_vector(
+        unit(0, 1), k=4, filter={"source_type": "qa"}
+    )
+    assert contents(results) == ["问答一", "问答二"]
+
+
+def test_persist_round_trip(store, fake_embeddings, tmp_path):
+    store.delete_by_source("问答-1")
+    store.save()
+    
+    loaded = NumpyVectorStore(fake_embeddings, persist_path=str(tmp_path / "index"))
+    
+    assert len(loaded) == 3
+    query = unit(0.8, 0.2)
+    assert contents(loaded.similarity_search_with_score_by_vector(query, k=3)) == contents(
+        store.similarity_search_with_score_by_vector(query, k=3)
+    )
+    assert [doc.page_content for doc in loaded.get_chunks([("航海手册-一", 1), ("问答-1", 0)])] == ["手册二"]
+    
+    loaded.drop()
+    assert not (tmp_path / "index" / "embeddings.npy").exists()
+
+
+def test_partitioned_store_routes_multi_value_filters(fake_embeddings, tmp_path):
+    store = PartitionedVectorStore(fake_embeddings, persist_path=str(tmp_path / "partitioned"))
+    store.add_embeddings(
+        ["手册", "问答", "案例", "无类型"],
+        [unit(1, 0), unit(0.9, 0.1), unit(0.8, 0.2), unit(0.7, 0.3)],
+        [
+            {"source": "航海手册-一", "source_type": "manual"},
+            {"source": "百问百答-1", "source_type": "qa"},
+            {"source": "爆款案例-a", "source_type": "case"},
+            {"source": "其他"}
+        ]
+    )
+    
+    for source_types in (["qa", "case"], {"$in": ["qa", "case"]}):
+        results = store.similarity_search_with_score_by_vector(
+            unit(1, 0), k=4, filter={"source_type": source_types}
+        )
+        assert contents(results) == ["问答", "案例"]
+    
+    results = store.similarity_search_with_score_by_vector(
+        unit(1, 0), k=4, filter={"source_type": {"$nin": ["manual"]}}
+    )
+    assert contents(results) == ["问答", "案例", "无类型"]
+    
+    assert store.delete_by_source(["航海手册-一", "百问百答-1"]) == 2
+    assert store.delete_by_source("爆款案例-", prefix=True) == 1
+    assert contents(store.similarity_search_with_score_by_vector(unit(1, 0), k=4)) == ["无类型"]